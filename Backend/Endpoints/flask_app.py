@@ -1,5 +1,117 @@
-from flask import Flask
+from flask import Flask, Response, request
+from collections import namedtuple
+import gzip
+import hashlib
 import json
+import os
+import re
+
+"""
+Stand-in for the Amazon and IMDB apis. Every fixture under the data root is read once at startup
+and indexed by the value it is requested by (search term, asin or imdb id). Responses are served
+from pre-serialized bytes, with ETags and gzip. To add a fixture just drop in a json file named
+like the existing ones, e.g. json/amazon/amazon_<term>_asin.json
+"""
+
+DATA_ROOT = os.environ.get("POV_FIXTURE_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "json"))
+
+NOT_FOUND = "<p>Error: Value passed not available...</p>"
+NO_VALUE = "<p>Error: You have no passed any values to be searched...</p>"
+
+Fixture = namedtuple("Fixture", ["name", "body", "gzipped", "etag"])
+
+
+def imdb_id(value):
+    """
+    "/title/tt1160419/" -> "tt1160419"
+    """
+    return value.strip("/").split("/")[-1]
+
+
+def normalize(term):
+    return term.lower().strip().replace(" ", "").replace("+", "")
+
+
+# file name pattern -> (fixture kind, function that gets the lookup key from the file name match and json)
+FIXTURE_TYPES = [
+    (re.compile(r"^amazon_(?P<term>.+)_asin\.json$"), "amazon/asin", lambda match, data: match.group("term")),
+    (re.compile(r"^amazon_(?P<term>.+)_reviews\.json$"), "amazon/reviews", lambda match, data: data["result"][0]["asin"]["original"]),
+    # further pages of reviews, e.g. amazon_<term>_reviews_2.json
+    (re.compile(r"^amazon_(?P<term>.+)_reviews_(?P<page>\d+)\.json$"), "amazon/reviews",
+     lambda match, data: page_key(data["result"][0]["asin"]["original"], int(match.group("page")))),
+    (re.compile(r"^imdb_(?P<term>.+)_id\.json$"), "imdb/id", lambda match, data: match.group("term")),
+    (re.compile(r"^imdb_(?P<term>.+)_movie_rating\.json$"), "imdb/rating", lambda match, data: imdb_id(data["id"])),
+    (re.compile(r"^imdb_(?P<term>.+)_review\.json$"), "imdb/review", lambda match, data: imdb_id(data["base"]["id"])),
+]
+
+
+def page_key(asin, page):
+    """
+    Fixture key of a page of reviews, page 1 is keyed on the asin alone
+    """
+    return asin if page <= 1 else "{}/{}".format(asin, page)
+
+
+class FixtureIndex:
+    """
+    Lookup from (kind, key) to a pre-serialized fixture response
+    """
+    def __init__(self, root):
+        self.root = root
+        self.fixtures = {}
+        self.load()
+
+    def load(self):
+        fixtures = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                for pattern, kind, get_key in FIXTURE_TYPES:
+                    match = pattern.match(filename)
+                    if match is None:
+                        continue
+                    with open(os.path.join(dirpath, filename)) as json_file:
+                        data = json.load(json_file)
+                    key = normalize(get_key(match, data))
+                    fixtures[(kind, key)] = self.serialize(match.group("term"), data)
+                    break
+        self.fixtures = fixtures
+
+    def serialize(self, name, data):
+        body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        etag = hashlib.sha1(body).hexdigest()
+        return Fixture(name, body, gzip.compress(body), etag)
+
+    def get(self, kind, key):
+        return self.fixtures.get((kind, normalize(key)))
+
+    def keys(self, kind):
+        return sorted((fixture.name, key) for (fixture_kind, key), fixture in self.fixtures.items() if fixture_kind == kind)
+
+
+index = FixtureIndex(DATA_ROOT)
+
+
+def fixture_response(kind, term):
+    """
+    Serves the fixture for term, a 304 if the client already has it, or the old html error
+    message if there is no such fixture
+    """
+    fixture = index.get(kind, term)
+    if fixture is None:
+        return NOT_FOUND
+    if request.if_none_match.contains(fixture.etag):
+        response = Response(status=304)
+        response.set_etag(fixture.etag)
+        return response
+    if request.accept_encodings["gzip"]:
+        response = Response(fixture.gzipped, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(fixture.body, mimetype="application/json")
+    response.headers["Vary"] = "Accept-Encoding"
+    response.set_etag(fixture.etag)
+    return response
+
 
 app = Flask(__name__)
 @app.route('/')
@@ -10,169 +122,68 @@ def welcome():
         <br>
         <p>List of API endpoints:</p>
         <br><br>
-        <p>Amazon:</p>
-        <ul>
-            <li><a href="/amazon/asin/Playstation5">Amazon Playstation5 asin</a></li>
-            <li><a href="/amazon/reviews/B08H95Y452">Amazon Playstation5 reviews</a></li>
-            <li><a href="/amazon/asin/Applewatch7">Amazon Apple Watch 7 asin</a></li>
-            <li><a href="/amazon/reviews/B09HH9GWYZ">Amazon Apple Watch 7 reviews</a></li>
-            <li><a href="/amazon/asin/Lindorchocolate">Amazon Lindor Chocolate asin</a></li>
-            <li><a href="/amazon/reviews/B00NW479QO">Amazon Lindor Chocolate reviews</a></li>
-            <li><a href="/amazon/asin/Potnoodle">Amazon Pot Noodle asin</a></li>
-            <li><a href="/amazon/reviews/B007XR2IOE">Amazon Pot Noodle reviews</a></li>
-        </ul>
-        <p>IMDB:</p>
-        <ul>
-            <li><a href="/imdb/id/Dune">IMDB Dune ID</a></li>
-            <li><a href="/imdb/rating/tt1160419">IMDB Dune Reviews</a></li>
-            <li><a href="/imdb/id/Inception">IMDB Inception ID</a></li>
-            <li><a href="/imdb/rating/tt1375666">IMDB Inception Reviews</a></li>
-            <li><a href="/imdb/id/jackandjill">IMDB Jack&Jill ID</a></li>
-            <li><a href="/imdb/rating/tt0810913">IMDB Jack&Jill Reviews</a></li>
-            <li><a href="/imdb/id/Insideout">IMDB Inside Out ID</a></li>
-            <li><a href="/imdb/rating/tt2096673">IMDB Inside Out Reviews</a></li>
-
-        </ul>
     """
+    for title, kinds in [("Amazon", ["amazon/asin", "amazon/reviews"]), ("IMDB", ["imdb/id", "imdb/rating", "imdb/review"])]:
+        homepage += "<p>{}:</p>\n<ul>\n".format(title)
+        for kind in kinds:
+            for name, key in index.keys(kind):
+                if "/" in key:
+                    # later review pages, served with ?page=
+                    continue
+                homepage += '<li><a href="/{0}/{1}">{2} {0}</a></li>\n'.format(kind, key, name)
+        homepage += "</ul>\n"
     return homepage
 
 
+def reviews_response(asin, page):
+    """
+    A page of reviews. Past the last page with a fixture the api's answer is a page without
+    any reviews
+    """
+    if page > 1 and index.get("amazon/reviews", page_key(asin, page)) is None:
+        first = index.get("amazon/reviews", asin)
+        if first is not None:
+            data = json.loads(first.body)
+            data["result"] = []
+            return Response(json.dumps(data), mimetype="application/json")
+    return fixture_response("amazon/reviews", page_key(asin, page))
+
+
 @app.route('/amazon/asin')
 def no_product():
-    return "<p>Error: You have no passed any values to be searched...</p>"
+    return NO_VALUE
 
 @app.route('/amazon/asin/<string:term>')
 def asin_val(term: str):
-    term = term.lower().strip()
-    term = term.replace(" ", "")
-    if term == "playstation5":
-        json_file = open("/home/louissullivcs/mysite/json/amazon/amazon_playstation5_asin.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "applewatch7":
-        json_file = open("/home/louissullivcs/mysite/json/amazon/amazon_applewatch7_asin.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "lindorchocolate":
-        json_file = open("/home/louissullivcs/mysite/json/amazon/amazon_lindor_asin.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "potnoodle":
-        json_file = open("/home/louissullivcs/mysite/json/amazon/amazon_potnoodle_asin.json")
-        variables = json.load(json_file)
-        json_file.close()
-    else:
-        variables = "<p>Error: Value passed not available...</p>"
-    return variables
+    return fixture_response("amazon/asin", term)
 
 @app.route('/amazon/reviews')
 def no_review():
-    return "<p>Error: You have no passed any values to be searched...</p>"
+    return NO_VALUE
 
 @app.route('/amazon/reviews/<string:term>')
 def review_val(term: str):
-    term = term.upper().strip()
-    term = term.replace(" ", "")
-    if term == "B08H95Y452":
-        json_file = open("/home/louissullivcs/mysite/json/amazon/amazon_playstation5_reviews.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "B09HH9GWYZ":
-        json_file = open("/home/louissullivcs/mysite/json/amazon/amazon_applewatch7_reviews.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "B00NW479QO":
-        json_file = open("/home/louissullivcs/mysite/json/amazon/amazon_lindor_reviews.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "B007XR2IOE":
-        json_file = open("/home/louissullivcs/mysite/json/amazon/amazon_potnoodle_reviews.json")
-        variables = json.load(json_file)
-        json_file.close()
-    else:
-        variables = "<p>Error: Value passed not available...</p>"
-    return variables
+    return reviews_response(term, request.args.get("page", 1, type=int))
 
 @app.route('/imdb/id')
 def no_movie():
-    return "<p>Error: You have no passed any values to be searched...</p>"
+    return NO_VALUE
 
 @app.route('/imdb/id/<string:term>')
 def id_val(term: str):
-    term = term.lower().strip()
-    term = term.replace(" ", "")
-    if term == "dune":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_dune_id.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "inception":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_inception_id.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "jackandjill":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_jackandjill_id.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "insideout":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_insideout_id.json")
-        variables = json.load(json_file)
-        json_file.close()
-    else:
-        variables = "<p>Error: Value passed not available...</p>"
-    return variables
+    return fixture_response("imdb/id", term)
 
 @app.route('/imdb/rating')
 def no_rating():
-    return "<p>Error: You have no passed any values to be searched...</p>"
+    return NO_VALUE
 
 @app.route('/imdb/rating/<string:term>')
 def rating_val(term: str):
-    term = term.lower().strip()
-    term = term.replace(" ", "")
-    term = term.replace("+", "")
-    if term == "tt1160419":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_dune_movie_rating.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "tt1375666":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_inception_movie_rating.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "tt2096673":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_jackandjill_movie_rating.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "tt0810913":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_insideout_movie_rating.json")
-        variables = json.load(json_file)
-        json_file.close()
-    else:
-        variables = "<p>Error: Value passed not available...</p>"
-    return variables
+    return fixture_response("imdb/rating", term)
 
 @app.route('/imdb/review/<string:term>')
-def rating_val(term: str):
-    term = term.lower().strip()
-    term = term.replace(" ", "")
-    if term == "tt1160419":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_dune_review.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "tt1375666":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_inception_review.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "tt2096673":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_jackandjill_review.json")
-        variables = json.load(json_file)
-        json_file.close()
-    elif term == "tt0810913":
-        json_file = open("/home/louissullivcs/mysite/json/imdb/imdb_insideout_review.json")
-        variables = json.load(json_file)
-        json_file.close()
-    else:
-        variables = "<p>Error: Value passed not available...</p>"
-    return variables
+def movie_review_val(term: str):
+    return fixture_response("imdb/review", term)
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run()
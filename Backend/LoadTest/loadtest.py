@@ -0,0 +1,113 @@
+import argparse
+import json
+import random
+import threading
+import time
+
+import requests
+
+"""
+Load driver for the results server. At each concurrency level it runs that many client threads,
+each with its own keep-alive session, requesting random searches for a fixed time, and reports
+throughput and latency percentiles. Run the server against simulator.py to test offline, e.g.
+
+    python loadtest.py --url http://127.0.0.1:5000 --concurrency 1,4,16,64 --duration 30
+"""
+
+# searches the simulator can answer: the fixture products and movies and any social term
+SEARCHES = [
+    ("playstation5", "product"), ("applewatch7", "product"), ("potnoodle", "product"), ("lindorchocolate", "product"),
+    ("dune", "movie"), ("inception", "movie"), ("insideout", "movie"), ("jackandjill", "movie"),
+    ("adele", "music"), ("fifa", "game"), ("football", "sport"), ("paris", "travel"),
+    ("russia", "politics"), ("beyonce", "celebrity"),
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def client(base_url, path, searches, deadline, results, lock):
+    """
+    Sends requests until the deadline and adds (seconds, ok) for each to results
+    """
+    session = requests.Session()
+    timings = []
+    while time.perf_counter() < deadline:
+        term, category = random.choice(searches)
+        url = base_url + path.format(term=term, category=category)
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=60)
+            ok = response.status_code == 200 and response.json().get("status") == "200"
+        except (requests.RequestException, ValueError):
+            ok = False
+        timings.append((time.perf_counter() - start, ok))
+    with lock:
+        results.extend(timings)
+
+
+def run_level(base_url, path, searches, concurrency, duration):
+    results = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(base_url, path, searches, deadline, results, lock))
+               for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies = sorted(seconds * 1000 for seconds, ok in results)
+    errors = sum(1 for seconds, ok in results if not ok)
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": errors,
+        "error_rate": round(errors / len(results), 4) if results else 0.0,
+        "throughput": round(len(results) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(latencies[-1], 1) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Results server load test")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="results server base url")
+    parser.add_argument("--path", default="/pov/results/{term}/{category}", help="e.g. /pov/aggregate/{term}/{category}")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="comma separated client counts")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per concurrency level")
+    parser.add_argument("--categories", default="", help="only search these comma separated categories")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="also write the results to this json file")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    searches = SEARCHES
+    if args.categories:
+        wanted = args.categories.split(",")
+        searches = [search for search in SEARCHES if search[1] in wanted]
+    if not searches:
+        parser.error("no searches in those categories")
+
+    print("{:>11} {:>9} {:>7} {:>10} {:>9} {:>9} {:>9} {:>9}".format(
+        "concurrency", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    levels = []
+    for concurrency in [int(level) for level in args.concurrency.split(",") if level]:
+        result = run_level(args.url, args.path, searches, concurrency, args.duration)
+        levels.append(result)
+        print("{concurrency:>11} {requests:>9} {errors:>7} {throughput:>10.2f} {p50_ms:>9.1f} {p95_ms:>9.1f} "
+              "{p99_ms:>9.1f} {max_ms:>9.1f}".format(**result), flush=True)
+    if args.out:
+        with open(args.out, "w") as out:
+            json.dump({"url": args.url, "path": args.path, "duration": args.duration, "levels": levels}, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
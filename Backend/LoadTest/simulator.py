@@ -0,0 +1,333 @@
+from flask import Flask, Response, request
+import argparse
+import functools
+import importlib.util
+import json
+import math
+import os
+import random
+import threading
+import time
+
+"""
+Local stand-in for every upstream api the results server calls, for offline load tests. Serves
+the Amazon and IMDB fixtures through the Endpoints fixture server's FixtureIndex, and synthetic
+Amazon review pages after the first, Twitter recent search and Reddit subreddit search pages made
+from the fixture review text.
+Every response can be delayed, failed or rate limited (429) at random, per upstream, see Faults.
+Start it and point the server at it with the urls printed by --print-env
+"""
+
+ENDPOINTS_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Endpoints", "flask_app.py")
+
+# posts each synthetic search has in total
+POSTS_PER_SEARCH = 1000
+# one new post per search every this many seconds, so repeat searches have something new
+NEW_POST_EVERY = 5
+DUPLICATE_RATE = 0.2
+# share of synthetic amazon reviews that are verified purchases
+VERIFIED_RATE = 0.85
+
+
+def load_endpoints():
+    """
+    Imports Backend/Endpoints/flask_app.py as a module, it is not a package
+    """
+    spec = importlib.util.spec_from_file_location("pov_endpoints", ENDPOINTS_APP)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+endpoints = load_endpoints()
+
+
+def review_sentences():
+    """
+    Sentences from every review in the fixtures, used to make up posts
+    """
+    sentences = []
+    for (kind, key), fixture in endpoints.index.fixtures.items():
+        data = json.loads(fixture.body)
+        if kind == "amazon/reviews":
+            texts = [review["review"] for review in data["result"]]
+        elif kind == "imdb/review":
+            texts = [review["reviewText"] for review in data["reviews"]]
+        else:
+            continue
+        for text in texts:
+            sentences.extend(s.strip() for s in text.split(".") if len(s.split()) >= 3)
+    return sorted(sentences)
+
+
+SENTENCES = review_sentences()
+
+
+class Faults:
+    """
+    Latency, error and rate limit settings per upstream ("amazon", "imdb", "twitter", "reddit"),
+    with "default" used for any upstream without its own. Latency is lognormal around
+    latency_ms with spread sigma
+    """
+    DEFAULTS = {"latency_ms": 50, "sigma": 0.5, "error_rate": 0.0, "ratelimit_rate": 0.0, "hang_rate": 0.0, "hang_ms": 30000}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.settings = {"default": dict(self.DEFAULTS)}
+        self.counts = {}
+
+    def update(self, upstream, **values):
+        with self._lock:
+            current = self.settings.setdefault(upstream, dict(self.settings["default"]))
+            for key, value in values.items():
+                if key not in self.DEFAULTS:
+                    raise ValueError("unknown fault setting " + key)
+                current[key] = float(value)
+
+    def get(self, upstream):
+        with self._lock:
+            return dict(self.settings.get(upstream, self.settings["default"]))
+
+    def count(self, upstream, outcome):
+        with self._lock:
+            key = "{}/{}".format(upstream, outcome)
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def apply(self, upstream):
+        """
+        Sleeps for the upstream's latency and returns an error response to send instead of the
+        real one, or None
+        """
+        config = self.get(upstream)
+        roll = random.random()
+        if roll < config["hang_rate"]:
+            time.sleep(config["hang_ms"] / 1000)
+            self.count(upstream, "hang")
+            return Response("upstream timed out", status=504)
+        latency = config["latency_ms"] * math.exp(random.gauss(0, config["sigma"])) if config["latency_ms"] > 0 else 0
+        time.sleep(latency / 1000)
+        roll -= config["hang_rate"]
+        if roll < config["ratelimit_rate"]:
+            self.count(upstream, "429")
+            response = Response(json.dumps({"title": "Too Many Requests"}), status=429, mimetype="application/json")
+            response.headers["x-rate-limit-remaining"] = "0"
+            response.headers["x-rate-limit-reset"] = str(int(time.time()) + 5)
+            return response
+        roll -= config["ratelimit_rate"]
+        if roll < config["error_rate"]:
+            self.count(upstream, "500")
+            return Response("simulated error", status=500)
+        self.count(upstream, "ok")
+        return None
+
+
+faults = Faults()
+
+
+@functools.lru_cache(maxsize=256)
+def search_texts(upstream, query):
+    """
+    The post texts of a search, the same every time for the same query
+    """
+    rand = random.Random("{}:{}".format(upstream, query))
+    term = query.split(" ")[0]
+    texts = []
+    for i in range(POSTS_PER_SEARCH):
+        if texts and rand.random() < DUPLICATE_RATE:
+            texts.append("RT @fan{} {}".format(rand.randint(1, 999), rand.choice(texts)))
+        else:
+            texts.append("{} {} {}".format(rand.choice(SENTENCES), term, rand.choice(SENTENCES)))
+    return texts
+
+
+def synthetic_posts(upstream, query, now=None):
+    """
+    The posts a search has right now, newest first, as (id, created, text). The same query always
+    gives the same posts, plus a new one every NEW_POST_EVERY seconds
+    """
+    if now is None:
+        now = time.time()
+    newest = int(now // NEW_POST_EVERY)
+    texts = search_texts(upstream, query.lower())
+    posts = []
+    for i in range(POSTS_PER_SEARCH):
+        number = newest - i
+        posts.append((number, number * NEW_POST_EVERY, texts[number % POSTS_PER_SEARCH]))
+    return posts
+
+
+def review_page(asin, page):
+    """
+    Page 2 onwards of an amazon product's reviews, made up from the first page's totals. Star
+    ratings follow the product's stars_stat, and the same page always has the same reviews
+    """
+    first = endpoints.index.get("amazon/reviews", asin)
+    if first is None:
+        return None
+    data = json.loads(first.body)
+    rand = random.Random("amazon:{}:{}".format(asin, page))
+    stars = [int(key) for key in data["stars_stat"]]
+    weights = [float(value.rstrip("%")) or 0.1 for value in data["stars_stat"].values()]
+    count = max(0, min(10, data["total_reviews"] - (page - 1) * 10))
+    data["result"] = [{"id": "SIM{}P{}R{}".format(asin, page, i), "asin": {"original": asin, "variant": ""},
+                       "rating": rand.choices(stars, weights)[0], "title": rand.choice(SENTENCES),
+                       "review": "{}. {}".format(rand.choice(SENTENCES), rand.choice(SENTENCES)),
+                       "verified_purchase": rand.random() < VERIFIED_RATE}
+                      for i in range(count)]
+    return Response(json.dumps(data), mimetype="application/json")
+
+
+app = Flask(__name__)
+
+
+@app.route('/amazon/asin/<string:term>')
+def amazon_asin(term: str):
+    return faults.apply("amazon") or endpoints.fixture_response("amazon/asin", term)
+
+@app.route('/amazon/reviews/<string:term>')
+def amazon_reviews(term: str):
+    error = faults.apply("amazon")
+    if error is not None:
+        return error
+    page = request.args.get("page", 1, type=int)
+    if page > 1:
+        return review_page(term, page) or endpoints.NOT_FOUND
+    return endpoints.fixture_response("amazon/reviews", term)
+
+@app.route('/imdb/id/<string:term>')
+def imdb_id(term: str):
+    return faults.apply("imdb") or endpoints.fixture_response("imdb/id", term)
+
+@app.route('/imdb/rating/<string:term>')
+def imdb_rating(term: str):
+    return faults.apply("imdb") or endpoints.fixture_response("imdb/rating", term)
+
+@app.route('/imdb/review/<string:term>')
+def imdb_review(term: str):
+    return faults.apply("imdb") or endpoints.fixture_response("imdb/review", term)
+
+
+@app.route('/2/tweets/search/recent')
+def twitter_search():
+    """
+    Twitter api v2 recent search: query, max_results, next_token and since_id
+    """
+    error = faults.apply("twitter")
+    if error is not None:
+        return error
+    query = request.args.get("query", "")
+    max_results = min(100, int(request.args.get("max_results", 10)))
+    start = int(request.args.get("next_token", 0))
+    since_id = request.args.get("since_id")
+    posts = synthetic_posts("twitter", query)
+    if since_id is not None:
+        posts = [post for post in posts if post[0] > int(since_id)]
+    page = posts[start:start + max_results]
+    body = {
+        "data": [{"id": str(number), "text": text, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(created))}
+                 for number, created, text in page],
+        "meta": {"result_count": len(page)},
+    }
+    if page:
+        body["meta"].update({"newest_id": str(page[0][0]), "oldest_id": str(page[-1][0])})
+    if start + max_results < len(posts):
+        body["meta"]["next_token"] = str(start + max_results)
+    response = Response(json.dumps(body), mimetype="application/json")
+    response.headers["x-rate-limit-remaining"] = "450"
+    response.headers["x-rate-limit-reset"] = str(int(time.time()) + 900)
+    return response
+
+
+@app.route('/api/v1/access_token', methods=["POST"])
+def reddit_token():
+    return Response(json.dumps({"access_token": "simulated", "token_type": "bearer", "expires_in": 3600, "scope": "*"}),
+                    mimetype="application/json")
+
+
+@app.route('/r/<string:subreddit>/search/', strict_slashes=False)
+def reddit_search(subreddit: str):
+    """
+    Reddit subreddit search listing: q, limit and after (a t3_ fullname)
+    """
+    error = faults.apply("reddit")
+    if error is not None:
+        return error
+    posts = synthetic_posts("reddit", request.args.get("q", ""))
+    limit = min(100, int(request.args.get("limit", 25)))
+    after = request.args.get("after")
+    start = 0
+    if after:
+        number = int(after[3:], 36)
+        start = next((i + 1 for i, post in enumerate(posts) if post[0] == number), len(posts))
+    page = posts[start:start + limit]
+    children = []
+    for number, created, text in page:
+        post_id = to_base36(number)
+        children.append({"kind": "t3", "data": {"id": post_id, "name": "t3_" + post_id, "title": text,
+                                                "subreddit": subreddit, "created_utc": float(created),
+                                                "permalink": "/r/{}/comments/{}/".format(subreddit, post_id)}})
+    last = children[-1]["data"]["name"] if children and start + limit < len(posts) else None
+    body = {"kind": "Listing", "data": {"after": last, "before": None, "dist": len(children), "children": children}}
+    return Response(json.dumps(body), mimetype="application/json")
+
+
+def to_base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        number, digit = divmod(number, 36)
+        out = digits[digit] + out
+        if number == 0:
+            return out
+
+
+@app.route('/_sim/faults', methods=["GET", "POST"])
+def fault_settings():
+    """
+    GET shows the fault settings. POST {"twitter": {"ratelimit_rate": 0.3}, ...} changes them
+    while the simulator is running
+    """
+    if request.method == "POST":
+        try:
+            for upstream, values in (request.get_json(force=True) or {}).items():
+                faults.update(upstream, **values)
+        except (ValueError, TypeError, AttributeError) as e:
+            return Response(json.dumps({"error": str(e)}), status=400, mimetype="application/json")
+    return Response(json.dumps({"settings": faults.settings, "counts": faults.counts}), mimetype="application/json")
+
+
+def print_env(base_url):
+    for name, value in [("AMAZON_BASE_URL", base_url), ("IMDB_BASE_URL", base_url), ("TWITTER_BASE_URL", base_url),
+                        ("REDDIT_URL", base_url), ("REDDIT_OAUTH_URL", base_url)]:
+        print("export POV_{}={}".format(name, value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upstream api simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--latency-ms", type=float, default=Faults.DEFAULTS["latency_ms"], help="median response latency")
+    parser.add_argument("--sigma", type=float, default=Faults.DEFAULTS["sigma"], help="spread of the lognormal latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of responses that are a 500")
+    parser.add_argument("--ratelimit-rate", type=float, default=0.0, help="share of responses that are a 429")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="share of requests that hang for --hang-ms then 504")
+    parser.add_argument("--hang-ms", type=float, default=Faults.DEFAULTS["hang_ms"])
+    parser.add_argument("--fault", action="append", default=[], metavar="UPSTREAM:KEY=VALUE",
+                        help="per upstream override, e.g. twitter:ratelimit_rate=0.2")
+    parser.add_argument("--print-env", action="store_true", help="print the server settings to use the simulator and exit")
+    args = parser.parse_args()
+
+    if args.print_env:
+        print_env("http://{}:{}".format(args.host, args.port))
+        return
+    faults.update("default", latency_ms=args.latency_ms, sigma=args.sigma, error_rate=args.error_rate,
+                  ratelimit_rate=args.ratelimit_rate, hang_rate=args.hang_rate, hang_ms=args.hang_ms)
+    for override in args.fault:
+        upstream, setting = override.split(":", 1)
+        key, value = setting.split("=", 1)
+        faults.update(upstream, **{key: value})
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
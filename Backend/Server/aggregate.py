@@ -0,0 +1,122 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import providers
+import settings
+import tracing
+
+"""
+Combined view of a search term across every provider that covers its category. The providers
+are queried at the same time under one overall deadline and whatever responded in time is merged
+into a single weighted rating.
+"""
+
+_executor = ThreadPoolExecutor(max_workers=settings.AGGREGATE_WORKERS, thread_name_prefix="pov-aggregate")
+
+MAX_REVIEWS = 10
+MAX_WORDS = 20
+
+
+def timed_search(search, term, category):
+    start = time.perf_counter()
+    result = search(term, category)
+    return result, time.perf_counter() - start
+
+
+def aggregate_search(term, category, deadline=None):
+    """
+    Runs every source for the category concurrently and merges the ones that answer with
+    status 200 before the deadline. Sources that are still running when the deadline passes are
+    left to finish in the background and reported as timed out
+    """
+    if deadline is None:
+        deadline = settings.AGGREGATE_DEADLINE
+    sources = providers.sources_for(category)
+    if not sources:
+        return {"status": "503", "msg": "Unavailable on all APIs"}
+
+    futures = {}
+    for name, search in sources:
+        futures[name] = _executor.submit(tracing.wrap(timed_search), search, term, category)
+    wait(list(futures.values()), timeout=deadline)
+
+    responded = []
+    source_status = {}
+    for name, future in futures.items():
+        if not future.done():
+            source_status[name] = {"status": "timeout"}
+            continue
+        try:
+            result, seconds = future.result()
+        except Exception as e:
+            source_status[name] = {"status": "error"}
+            continue
+        if result.get("status") == "200":
+            responded.append((name, result))
+            source_status[name] = {"status": "ok", "rating": result.get("rating"), "seconds": round(seconds, 3)}
+        else:
+            source_status[name] = {"status": "unavailable", "seconds": round(seconds, 3)}
+
+    merged = merge_results(responded)
+    merged.update({"sources": source_status})
+    return merged
+
+
+def merge_results(responded):
+    """
+    Merges (source name, result) pairs into one result. The rating is the weighted mean of the
+    source ratings, label counts and word bubbles are summed and reviews are taken in turn from
+    each source. total_reviews counts the posts and reviews the ratings come from, star ratings
+    (IMDb's rating_count) are summed apart in rating_count
+    """
+    if not responded:
+        return {"status": "503", "msg": "Entry unavailable"}
+
+    weighted_total = 0
+    weight_sum = 0
+    total_reviews = 0
+    rating_count = 0
+    label_counts = Counter()
+    words = Counter()
+    for name, result in responded:
+        weight = settings.AGGREGATE_WEIGHTS.get(name, 1)
+        weighted_total += float(result["rating"]) * weight
+        weight_sum += weight
+        total_reviews += parse_count(result.get("total_reviews"))
+        rating_count += parse_count(result.get("rating_count"))
+        label_counts.update(result.get("label_counts", {}))
+        for word, count in result.get("word_bubble", []):
+            words[word] += count
+
+    rating = int(weighted_total / weight_sum) if weight_sum else 0
+    return {
+        "status": "200",
+        "rating": str(rating),
+        "total_reviews": total_reviews,
+        "rating_count": rating_count,
+        "label_counts": dict(label_counts),
+        "reviews": interleave([result.get("reviews") or [] for name, result in responded], MAX_REVIEWS),
+        "word_bubble": [[word, count] for word, count in words.most_common(MAX_WORDS)],
+    }
+
+
+def parse_count(value):
+    """
+    A count from a result, "486,697" -> 486697, missing or unreadable counts are 0
+    """
+    try:
+        return int(str(value).replace(",", "")) if value is not None else 0
+    except ValueError:
+        return 0
+
+
+def interleave(lists, limit):
+    merged = []
+    i = 0
+    while len(merged) < limit and any(i < len(values) for values in lists):
+        for values in lists:
+            if i < len(values) and len(merged) < limit:
+                merged.append(values[i])
+        i += 1
+    return merged
@@ -1,53 +1,358 @@
-import requests
+import asyncio
+import functools
 import json
+import math
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import settings
+import tracing
+from apis import clients
+from apis.analysis.aggregator import SentimentAggregator
+from apis.analysis.registry import remove_emoji, score_many
+from apis.budget import IngestBudget
+from apis.fetch import FetchGraph
 
 """
 Uses data from https://rapidapi.com/restyler/api/amazon23/
 """
+
+# reviews per page of the reviews endpoint
+PAGE_SIZE = 10
+# review texts shown in the result
+SHOWN_REVIEWS = 10
+
+_lock = threading.Lock()
+_page_executor = None
+
+def page_executor():
+    """
+    Threads the review pages are fetched on, kept apart from the fetch pool so a few product
+    searches paging through reviews can't hold up the other providers' fetches
+    """
+    global _page_executor
+    if _page_executor is None:
+        with _lock:
+            if _page_executor is None:
+                _page_executor = ThreadPoolExecutor(max_workers=settings.AMAZON_PAGE_WORKERS,
+                                                    thread_name_prefix="pov-amazon-pages")
+    return _page_executor
+
+def asin_url(term):
+    return "{}/amazon/asin/{}".format(settings.AMAZON_BASE_URL, str(term))
+
+def reviews_url(asin):
+    return "{}/amazon/reviews/{}".format(settings.AMAZON_BASE_URL, str(asin))
+
+def page_params(page):
+    # page 1 is requested without a page parameter, as before paging
+    return {"page": page} if page > 1 else None
+
+def new_budget():
+    return IngestBudget(settings.AMAZON_MAX_REVIEWS, settings.AMAZON_MAX_PAGES, settings.AMAZON_DEADLINE, PAGE_SIZE)
+
+def last_page(first, budget):
+    """
+    Number of review pages to fetch, from the total in the first page and the budget, and the
+    budget limit that cut it short or None
+    """
+    available = math.ceil(first.get("total_reviews", 0) / PAGE_SIZE) if first.get("result") else 1
+    allowed = min(budget.max_pages, math.ceil(budget.max_items / PAGE_SIZE))
+    if available <= allowed:
+        return max(1, available), None
+    return allowed, "max_pages" if allowed == budget.max_pages else "max_posts"
+
+def review_key(review):
+    return review.get("id") or (review.get("name"), review.get("review"))
+
+class ReviewPager:
+    """
+    Decides which review pages to fetch next and counts them, and their reviews, against the
+    budget. Pages are fetched one at a time until a page beyond the first has brought new reviews,
+    then up to AMAZON_PAGE_CONCURRENCY at a time. Nothing more is scheduled once a page comes back
+    empty or with only reviews already seen, which is where the listing ends (or where an api that
+    ignores ?page repeats page 1)
+    """
+    def __init__(self, first, budget):
+        self.budget = budget
+        self.seen = set()
+        self.pages = {}
+        self.last, self.limit = last_page(first, budget)
+        self.next_page = 2
+        self.window = 1
+        budget.take_page()
+        self.exhausted = not self.add(1, first)
+
+    def take_reviews(self, data):
+        """
+        The reviews of a page that haven't been seen before and fit in the budget
+        """
+        reviews = []
+        for review in data.get("result") or []:
+            key = review_key(review)
+            if key in self.seen:
+                continue
+            self.seen.add(key)
+            if not self.budget.take_item():
+                break
+            reviews.append(review)
+        return reviews
+
+    def to_fetch(self, running):
+        """
+        The pages to start with running pages in flight. Each is counted against the budget,
+        which is marked as truncated by the deadline if it has passed with pages left
+        """
+        pages = []
+        while not self.exhausted and self.next_page <= self.last and running + len(pages) < self.window:
+            if not self.budget.take_page():
+                break
+            pages.append(self.next_page)
+            self.next_page += 1
+        return pages
+
+    def add(self, page, data):
+        """
+        Keeps a fetched page with only its new reviews, returns how many there were
+        """
+        reviews = self.take_reviews(data)
+        self.pages[page] = dict(data, result=reviews)
+        if page > 1:
+            if reviews:
+                self.window = settings.AMAZON_PAGE_CONCURRENCY
+            else:
+                self.exhausted = True
+        return len(reviews)
+
+    def finish(self):
+        """
+        The fetched pages in order. The budget limit only counts as truncating the reviews if the
+        pages ran out before the reviews did
+        """
+        if self.limit is not None and not self.exhausted:
+            self.budget.stop(self.limit)
+        return [self.pages[page] for page in sorted(self.pages)]
+
+def fetch_review_pages(asin, budget):
+    """
+    Fetches the first reviews page and then the rest as ReviewPager schedules them, until the
+    budget runs out. Returns the pages in order. A page that fails or doesn't arrive before the
+    deadline is left out and the budget is marked as truncated
+    """
+    first = clients.get(reviews_url(asin), upstream="amazon").json()
+    pager = ReviewPager(first, budget)
+    running = {}
+    while True:
+        for page in pager.to_fetch(len(running)):
+            running[page_executor().submit(tracing.wrap(fetch_review_page), asin, page)] = page
+        if not running:
+            break
+        done, not_done = wait(running, timeout=max(0, budget.remaining_time()), return_when=FIRST_COMPLETED)
+        if not done:
+            # the rest are left to finish in the background
+            budget.stop("deadline")
+            break
+        for future in done:
+            page = running.pop(future)
+            try:
+                pager.add(page, future.result())
+            except Exception:
+                budget.stop("page_error")
+    return pager.finish()
+
+def fetch_review_page(asin, page):
+    return clients.get(reviews_url(asin), upstream="amazon", params=page_params(page)).json()
+
+async def fetch_review_pages_async(asin, budget):
+    """
+    fetch_review_pages() for async_app.py
+    """
+    from apis import async_clients
+
+    async def fetch(page):
+        response = await async_clients.get(reviews_url(asin), upstream="amazon", params=page_params(page))
+        return response.json()
+
+    pager = ReviewPager(await fetch(1), budget)
+    running = {}
+    while True:
+        for page in pager.to_fetch(len(running)):
+            running[asyncio.ensure_future(fetch(page))] = page
+        if not running:
+            break
+        done, not_done = await asyncio.wait(running, timeout=max(0, budget.remaining_time()),
+                                            return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            budget.stop("deadline")
+            for task in not_done:
+                task.cancel()
+            break
+        for task in done:
+            page = running.pop(task)
+            if task.exception() is not None:
+                budget.stop("page_error")
+                continue
+            pager.add(page, task.result())
+    return pager.finish()
+
+def percent(value):
+    """
+    "84%" -> 84.0, numbers are returned as they are and anything else counts as 0
+    """
+    try:
+        return float(str(value).strip().rstrip("%"))
+    except ValueError:
+        return 0.0
+
+def clean_review(text):
+    return " ".join(remove_emoji(str(text)).split())
+
+
+class StarHistogram:
+    """
+    Counts of the 1 to 5 star ratings of individual reviews, for all of them and for verified
+    purchases only
+    """
+    def __init__(self):
+        self.counts = {stars: 0 for stars in range(1, 6)}
+        self.verified = {stars: 0 for stars in range(1, 6)}
+
+    def add(self, rating, verified=False):
+        try:
+            stars = int(round(float(rating)))
+        except (TypeError, ValueError):
+            return
+        if stars not in self.counts:
+            return
+        self.counts[stars] += 1
+        if verified:
+            self.verified[stars] += 1
+
+    def total(self, counts=None):
+        return sum((counts or self.counts).values())
+
+    def positive(self, counts=None):
+        """
+        Percentage of 4 and 5 star reviews, like the rating from stars_stat
+        """
+        counts = counts or self.counts
+        total = self.total(counts)
+        if total == 0:
+            return None
+        return int(round((counts[4] + counts[5]) / total * 100))
+
+    def average(self, counts=None):
+        counts = counts or self.counts
+        total = self.total(counts)
+        if total == 0:
+            return None
+        return round(sum(stars * count for stars, count in counts.items()) / total, 2)
+
+    def as_dict(self, counts=None):
+        return {str(stars): count for stars, count in (counts or self.counts).items()}
+
+def read_asin(response):
+    """
+    The asin of the first product in an asin search response, or None if nothing was found
+    """
+    response_type = response.headers
+    #if the value returned is a json file
+    if response_type["Content-Type"] == 'application/json':
+        #get the json values from what was returned
+        data = response.json()
+        #get asins value from the first result
+        return data["result"][0]["asin"]
+    else:
+        #else we did not find the value so we return nothing
+        return None
+
 class AmazonData:
     """
     Gets reviews from amazon api using a inputted search term
     *Currently requests to a custom server due to API payment issues*
     """
-    def __init__(self, term):
+    def __init__(self, term, fetched=None, budget=None):
+        """
+        fetched can be passed to build the result from already downloaded json instead of
+        calling the api, see fetch() for its keys
+        """
         self.term = term
         self.api_response = ""
-        self.asin = self.get_product_asin()
-        self.stars = self.get_stars()
-        self.rating = self.get_rating()
-        self.reviews = self.get_reviews()
-        self.result = self.final_result()
+        self.budget = budget or new_budget()
+        if fetched is None:
+            with tracing.span("fetch"):
+                fetched = self.fetch()
+        with tracing.span("parse"):
+            self.asin = fetched["asin"]
+            self.pages = fetched["pages"] or []
+            # the first page has the product's totals
+            self.api_response = self.pages[0] if self.pages else None
+            self.stars = self.get_stars()
+            self.review_data = self.get_review_data()
+            self.histogram = self.get_histogram()
+            self.rating = self.get_rating()
+            self.reviews = self.get_reviews()
+        with tracing.span("score"):
+            self.text_scores = self.score_reviews()
+        with tracing.span("aggregate"):
+            self.text_result = self.aggregate_scores()
+            self.result = self.final_result()
+        tracing.count_posts("amazon", len(self.review_data))
 
     def getResult(self):
         return self.result
 
+    def fetch(self):
+        """
+        Fetches the asin and then the review pages for it, "pages" is a list of the reviews
+        json of each page
+        """
+        graph = FetchGraph()
+        graph.add("asin", self.get_product_asin)
+        graph.add("pages", self.fetch_reviews, "asin")
+        return graph.run()
+
+    @classmethod
+    async def create_async(cls, term, executor=None):
+        """
+        Builds the AmazonData for term without blocking the event loop, for async_app.py. The
+        reviews are scored on executor
+        """
+        from apis import async_clients
+        budget = new_budget()
+        with tracing.span("fetch"):
+            asin = read_asin(await async_clients.get(asin_url(term), upstream="amazon"))
+            pages = None
+            if asin is not None:
+                pages = await fetch_review_pages_async(asin, budget)
+        build = functools.partial(cls, term, fetched={"asin": asin, "pages": pages}, budget=budget)
+        return await asyncio.get_running_loop().run_in_executor(executor, tracing.wrap(build))
+
     def get_product_asin(self):
         """
         Get the related amazon asin (product id) number from the search term
         """
-        response = requests.get("https://louissullivcs.pythonanywhere.com/amazon/asin/{}".format(str(self.term))) 
-        response_type = response.headers
+        return read_asin(clients.get(asin_url(self.term), upstream="amazon"))
         #if the value returned is a json file
-        if response_type["Content-Type"] == 'application/json':
-            #get the json values from what was returned
-            data = response.json()
-            #get asins value from the first result
-            return data["result"][0]["asin"]
+    
+    def fetch_reviews(self, asin):
+        """
+        Get the review pages of a product from the related asin number
+        """
+        #if the asin is not none
+        if asin != None:
+            # get the reviews from the custom server using the asin number
+            # runs on the calling thread, the pages are fetched on page_executor()
+            return fetch_review_pages(asin, self.budget)
         else:
-            #else we did not find the value so we return nothing
             return None
-    
+
     def get_stars(self):
         """
-        Get the star ratings of a product from the related asin number
+        Get the star ratings of a product from the fetched reviews
         """
-        #if the asin is not none
         if self.asin != None:
-            # get the reviews from the custom server using the asin number
-            response = requests.get("https://louissullivcs.pythonanywhere.com/amazon/reviews/{}".format(str(self.asin)))
-            self.api_response = response.json()
             #get the star ratings from the returned json
-            reviews = self.api_response["stars_stat"]
+            reviews = self.api_response.get("stars_stat")
             return reviews
         else:
             #else we could not find the stars so we return none
@@ -55,30 +360,67 @@ class AmazonData:
     
     def get_rating(self):
         """
-        Return value of 4 and 5 star ratings together, which is our positive rating result
+        Return value of 4 and 5 star ratings together, which is our positive rating result. Uses
+        the stars_stat percentages, which cover every review, or the fetched reviews' own star
+        ratings if there are none
         """
         if self.asin != None:
-            for key, val in self.stars.items():
-                if key == '4':
-                    fourstars = val[:-1]
-                elif key == "5":
-                    fivestars = val[:-1]
-                    total = int(fourstars) + int(fivestars)
-            return total
+            #stars_stat keys are "1" to "5" with values like "84%"
+            stars = {str(key).strip(): val for key, val in (self.stars or {}).items()}
+            if "4" in stars or "5" in stars:
+                return int(round(percent(stars.get("4", 0)) + percent(stars.get("5", 0))))
+            return self.histogram.positive()
         else:
             return None
 
-    def get_reviews(self):
-        i = 0
+    def get_review_data(self):
+        """
+        Every review on the fetched pages, once each (pages can overlap if reviews are added
+        while they are fetched). Pages fetched by ReviewPager have already been counted against
+        the budget, pages passed in from elsewhere (precompute.py) are counted here
+        """
         reviews = []
+        seen = set()
+        counted = self.budget.pages > 0
         if self.asin != None:
-            while i < len(self.api_response['result']):
-                reviews.append(self.api_response["result"][i]["review"])
-                i += 1
-            return reviews
+            for page in self.pages:
+                if not counted and not self.budget.take_page():
+                    break
+                for review in page.get("result") or []:
+                    key = review_key(review)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    if not counted and not self.budget.take_item():
+                        break
+                    reviews.append(review)
+        return reviews
+
+    def get_histogram(self):
+        histogram = StarHistogram()
+        for review in self.review_data:
+            histogram.add(review.get("rating"), review.get("verified_purchase", False))
+        return histogram
+
+    def get_reviews(self):
+        if self.asin != None:
+            return [review.get("review", "") for review in self.review_data[:SHOWN_REVIEWS]]
         else:
             return None
-    
+
+    def score_reviews(self):
+        """
+        Scores every review's text with the shared sentiment engine
+        """
+        texts = [clean_review(review.get("review", "")) for review in self.review_data]
+        return score_many([text for text in texts if text])
+
+    def aggregate_scores(self):
+        aggregator = SentimentAggregator(50)
+        for pol_score in self.text_scores:
+            aggregator.add(pol_score)
+        return aggregator.result()
+
 
     def final_result(self):
         if self.asin != None:
@@ -89,6 +431,25 @@ class AmazonData:
             reviews = {"reviews": self.reviews}
             result.update(total)
             result.update(reviews)
+            #ratings worked out from the individual reviews that were fetched
+            if self.histogram.total():
+                verified = self.histogram.positive(self.histogram.verified)
+                stars = {
+                    "star_rating": str(self.histogram.positive()),
+                    "average_stars": self.histogram.average(),
+                    "verified_star_rating": str(verified) if verified is not None else None,
+                    "star_histogram": self.histogram.as_dict(),
+                    "verified_histogram": self.histogram.as_dict(self.histogram.verified),
+                }
+                result.update(stars)
+            if self.text_result["status"] == "200":
+                text = {
+                    "text_rating": self.text_result["rating"],
+                    "label_counts": self.text_result["label_counts"],
+                    "word_bubble": self.text_result["word_bubble"],
+                }
+                result.update(text)
+            result.update(self.budget.metadata())
             return result
         else:
             result_string = '{"status": "503", "msg": "Entry unavailable"}'
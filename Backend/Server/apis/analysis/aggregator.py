@@ -0,0 +1,98 @@
+import heapq
+
+from apis.analysis.registry import label
+from apis.analysis.wordbubble import WordBubble, tokenize
+
+"""
+Builds the social provider result from scored posts one at a time, without keeping the posts.
+"""
+
+MAX_HEADLINES = 5
+MAX_WORDS = 20
+
+
+class SentimentAggregator:
+    """
+    Keeps label counts, the most strongly positive and negative headlines and the word counts for
+    each label. positive_threshold is the rating above which the positive headlines and words are
+    shown in the result rather than the negative ones
+    """
+    def __init__(self, positive_threshold, max_headlines=MAX_HEADLINES, max_words=MAX_WORDS):
+        self.positive_threshold = positive_threshold
+        self.max_headlines = max_headlines
+        self.max_words = max_words
+        self.counts = {1: 0, 0: 0, -1: 0}
+        # min heaps of (strength, headline), the weakest is dropped once full
+        self.headlines = {1: [], -1: []}
+        self.words = {1: WordBubble(), -1: WordBubble()}
+
+    def add(self, pol_score, weight=1, show=True):
+        """
+        Adds one polarity dict from the registry, counted weight times (e.g. for a post that
+        stands for a cluster of near-duplicates). show=False keeps the headline out of the
+        result, e.g. for a near-duplicate of one already added. Returns the post's label
+        """
+        post_label = label(pol_score['compound'])
+        self.counts[post_label] += weight
+        if post_label != 0:
+            line = pol_score['headline']
+            if show:
+                item = (abs(pol_score['compound']), line)
+                heap = self.headlines[post_label]
+                if len(heap) < self.max_headlines:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            self.words[post_label].add_tokens(tokenize(line), weight)
+        return post_label
+
+    def merge(self, other):
+        """
+        Adds the counts, headlines and words of another aggregator, e.g. from another shard
+        """
+        for post_label in self.counts:
+            self.counts[post_label] += other.counts[post_label]
+        for post_label in self.headlines:
+            merged = heapq.nlargest(self.max_headlines, self.headlines[post_label] + other.headlines[post_label])
+            heapq.heapify(merged)
+            self.headlines[post_label] = merged
+            self.words[post_label].merge(other.words[post_label])
+        return self
+
+    def total(self):
+        return self.counts[1] + self.counts[0] + self.counts[-1]
+
+    def label_counts(self):
+        return {'positive': self.counts[1], 'neutral': self.counts[0], 'negative': self.counts[-1]}
+
+    def rating(self):
+        """
+        Percentage of posts that are positive or neutral
+        """
+        total = self.total()
+        if total == 0:
+            return 0
+        return int((self.counts[1] + self.counts[0]) / total * 100)
+
+    def top_headlines(self, post_label):
+        return [line for strength, line in sorted(self.headlines[post_label], reverse=True)]
+
+    def progress(self):
+        return {'total_reviews': self.total(), 'label_counts': self.label_counts(), 'rating': str(self.rating())}
+
+    def result(self):
+        """
+        The final provider result, or a 503 if nothing was added
+        """
+        if self.total() == 0:
+            return {'status': "503", "msg": "Entry unavailable"}
+        rating = self.rating()
+        shown = 1 if rating > self.positive_threshold else -1
+        return {
+            'status': "200",
+            'total_reviews': self.total(),
+            'label_counts': self.label_counts(),
+            'rating': str(rating),
+            'reviews': self.top_headlines(shown),
+            'word_bubble': self.words[shown].top(self.max_words),
+        }
@@ -0,0 +1,62 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import settings
+
+"""
+Scores large batches of text on a pool of worker processes so CPU bound scoring uses every core.
+Each worker loads its models once when it starts. Small batches are scored in the calling process,
+where starting the work on the pool would cost more than it saves. Results keep the input order.
+"""
+
+_lock = threading.Lock()
+_pool = None
+
+
+def _init_worker():
+    from apis.analysis.registry import registry
+    registry.preload()
+
+
+def _score_chunk(kind, texts):
+    """
+    Scores texts in the current process. kind is "vader" for VADER polarity dicts or "textblob"
+    for TextBlob polarity floats
+    """
+    if kind == "vader":
+        from apis.analysis.registry import registry
+        return [registry.score(text) for text in texts]
+    elif kind == "textblob":
+        from textblob import TextBlob
+        return [float(TextBlob(text).sentiment.polarity) for text in texts]
+    raise ValueError("Unknown scoring kind {}".format(kind))
+
+
+def pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                context = multiprocessing.get_context(settings.SCORING_START_METHOD)
+                _pool = ProcessPoolExecutor(max_workers=settings.SCORING_PROCESSES, mp_context=context,
+                                            initializer=_init_worker)
+    return _pool
+
+
+def chunks(texts, size):
+    return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+
+def score_batch(kind, texts):
+    """
+    Scores texts with the given kind of scorer, on the process pool if there are enough of them
+    """
+    texts = list(texts)
+    if len(texts) < settings.SCORING_BATCH_MIN_SIZE or settings.SCORING_PROCESSES <= 1:
+        return _score_chunk(kind, texts)
+    parts = chunks(texts, settings.SCORING_CHUNK_SIZE)
+    results = []
+    for part in pool().map(_score_chunk, [kind] * len(parts), parts):
+        results.extend(part)
+    return results
@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import settings
+
+"""
+Remembers where the last search for a term got to (a "cursor", e.g. the newest tweet id) and the
+aggregate built so far, so a repeat search only needs to fetch and score posts newer than the
+cursor and merge them into the saved aggregate. Merged states keep the time of the full search
+they started from, so max_age still forces a full search every so often.
+"""
+
+# saved_at is when the full search the aggregator was built on ran
+CursorState = namedtuple("CursorState", ["cursor", "aggregator", "saved_at"])
+
+
+class CursorStore:
+    """
+    Size bounded, least recently used first store of CursorStates per provider and search
+    """
+    def __init__(self, max_size, max_age):
+        self.max_size = max_size
+        self.max_age = max_age
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, provider, term, category=None):
+        """
+        The saved state for the search, or None if there isn't one or it is too old to build on
+        """
+        key = (provider, term.upper(), category)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return None
+            if time.monotonic() - state.saved_at > self.max_age:
+                del self._states[key]
+                return None
+            self._states.move_to_end(key)
+            return state
+
+    def save(self, provider, term, category, cursor, aggregator, previous=None):
+        """
+        Saves the state after a search. previous is the state an incremental search merged into
+        aggregator, whose saved_at is kept. The aggregator must not be changed after it is saved,
+        merge it into a new one instead
+        """
+        key = (provider, term.upper(), category)
+        saved_at = previous.saved_at if previous is not None else time.monotonic()
+        with self._lock:
+            self._states[key] = CursorState(cursor, aggregator, saved_at)
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_size:
+                self._states.popitem(last=False)
+
+
+cursors = CursorStore(settings.CURSOR_STORE_SIZE, settings.CURSOR_MAX_AGE)
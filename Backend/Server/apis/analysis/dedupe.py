@@ -0,0 +1,117 @@
+import re
+import zlib
+
+import numpy as np
+
+import settings
+
+"""
+Groups near-duplicate posts (retweet chains, quote tweets, cross-posts that differ by a link or a
+few words) so only one post per group is scored. Each post gets a MinHash signature of its word
+shingles, and an LSH index of signature bands finds the earlier posts it might duplicate.
+"""
+
+# small enough that a * x + b fits in an int64
+MERSENNE_PRIME = (1 << 31) - 1
+
+word_pattern = re.compile(r"\w+")
+
+
+def shingles(text):
+    """
+    The hashed words and word pairs of a post. Posts are short so single words are kept too,
+    otherwise one changed word would drop most of the shingles
+    """
+    words = word_pattern.findall(text.lower())
+    grams = set(words)
+    grams.update(" ".join(words[i:i + 2]) for i in range(len(words) - 1))
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) % MERSENNE_PRIME for gram in grams), dtype=np.int64, count=len(grams))
+
+
+class MinHasher:
+    """
+    num_perm random hash functions (a * x + b) mod p, the same ones every run
+    """
+    def __init__(self, num_perm, seed=1):
+        rand = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rand.randint(1, MERSENNE_PRIME, size=(num_perm, 1), dtype=np.int64)
+        self.b = rand.randint(0, MERSENNE_PRIME, size=(num_perm, 1), dtype=np.int64)
+
+    def signature(self, hashes):
+        if len(hashes) == 0:
+            return np.full(self.num_perm, MERSENNE_PRIME, dtype=np.int64)
+        return ((self.a * hashes + self.b) % MERSENNE_PRIME).min(axis=1)
+
+
+def similarity(sig1, sig2):
+    """
+    Estimated jaccard similarity of two signatures
+    """
+    return np.count_nonzero(sig1 == sig2) / len(sig1)
+
+
+class NearDuplicates:
+    """
+    Assigns posts to clusters as they arrive. A post joins the cluster of the first earlier
+    representative that shares an LSH band with it and is at least threshold similar, otherwise
+    it starts a new cluster and becomes its representative
+    """
+    def __init__(self, threshold=None, num_perm=None, bands=None):
+        self.threshold = threshold if threshold is not None else settings.DEDUPE_THRESHOLD
+        num_perm = num_perm or settings.DEDUPE_NUM_PERM
+        self.bands = bands or settings.DEDUPE_BANDS
+        self.rows = num_perm // self.bands
+        self.hasher = MinHasher(self.rows * self.bands)
+        # one dict per band from band values to the clusters that have them
+        self.index = [{} for i in range(self.bands)]
+        self.signatures = []
+        self.representatives = []
+        self.sizes = []
+
+    def band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, text):
+        """
+        Adds a post and returns (cluster number, whether the post started the cluster)
+        """
+        signature = self.hasher.signature(shingles(text))
+        keys = self.band_keys(signature)
+        checked = set()
+        for band, key in zip(self.index, keys):
+            for cluster in band.get(key, ()):
+                if cluster in checked:
+                    continue
+                checked.add(cluster)
+                if similarity(signature, self.signatures[cluster]) >= self.threshold:
+                    self.sizes[cluster] += 1
+                    return cluster, False
+        cluster = len(self.representatives)
+        self.signatures.append(signature)
+        self.representatives.append(text)
+        self.sizes.append(1)
+        for band, key in zip(self.index, keys):
+            band.setdefault(key, []).append(cluster)
+        return cluster, True
+
+    def clusters(self):
+        """
+        (representative post, cluster size) pairs in the order the clusters were started
+        """
+        return list(zip(self.representatives, self.sizes))
+
+
+def collapse(texts, enabled=None):
+    """
+    Groups texts into near-duplicate clusters and returns (representative, size) pairs. With
+    deduplication turned off every text is its own cluster
+    """
+    if enabled is None:
+        enabled = settings.DEDUPE_ENABLED
+    if not enabled:
+        return [(text, 1) for text in texts]
+    duplicates = NearDuplicates()
+    for text in texts:
+        duplicates.add(text)
+    return duplicates.clusters()
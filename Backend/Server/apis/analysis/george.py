@@ -1,4 +1,5 @@
-from textblob import TextBlob
+from apis.analysis.batch import score_batch
+from apis.analysis.spelling import get_corrector
 
 
 class George:
@@ -6,8 +7,15 @@ class George:
     This class analysises passed values using textblob and outputs a positive rating
     as a total of all the values passed
     """
-    def __init__(self, input):
+    def __init__(self, input, corrector=None):
+        """
+        corrector is a spelling corrector from apis/analysis/spelling.py or the name of one,
+        defaults to settings.GEORGE_CORRECTOR
+        """
         self.data = input
+        if corrector is None or isinstance(corrector, str):
+            corrector = get_corrector(corrector)
+        self.corrector = corrector
         self.total_sentiments = 0
         self.total_positve = 0
         self.total_negative = 0
@@ -23,8 +31,7 @@ class George:
         """
         newlist = []
         for val in self.data:
-            val = TextBlob(val)
-            spelled = val.correct()
+            spelled = self.corrector.correct(val)
             newlist.append(str(spelled))
         self.clean_data = newlist
         self.getSentiments()
@@ -34,10 +41,9 @@ class George:
         Function that gets the polaity of each value passed and counts the positive,
         negative, neutal and total reviews.
         """
-        for val in self.clean_data:
-            val = TextBlob(val)
-            #Polaity value is a float of how positive, negative or neutral a text value is
-            polarity = float(val.sentiment.polarity)
+        #Polaity value is a float of how positive, negative or neutral a text value is
+        #large inputs are scored on a process pool, see apis/analysis/batch.py
+        for polarity in score_batch("textblob", self.clean_data):
             self.pol = polarity
             self.total_sentiments += 1
             if polarity >= 0.1:
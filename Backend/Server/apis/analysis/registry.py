@@ -0,0 +1,114 @@
+import re
+import threading
+
+"""
+Shared nltk models for the social providers (reddit and twitter).
+Loading VADER's lexicon and the stopword corpus is slow, so it is done once per process
+instead of on every request. Call preload() before workers fork to share the loaded models.
+"""
+
+emoji_pattern = re.compile("["
+    u"\U0001F600-\U0001F64F" u"\U0001F680-\U0001F6FF" u"\U0001F1E0-\U0001F1FF" u"\U00002500-\U00002BEF"  
+    u"\U00002702-\U000027B0"u"\U00002702-\U000027B0"u"\U000024C2-\U0001F251"u"\U0001f926-\U0001f937"
+    u"\U00010000-\U0010ffff"u"\u2640-\u2642"u"\u2600-\u2B55"u"\u200d"u"\u23cf"u"\u23e9"u"\u231a"
+    u"\ufe0f"u"\u3030""]+", flags=re.UNICODE)
+
+
+class AnalysisRegistry:
+    """
+    Lazily loads and holds the sentiment analyzer, stopword set and tokenizer so every
+    request in the process uses the same instances
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._analyzer = None
+        self._stop_words = None
+        self._tokenizer = None
+
+    def analyzer(self):
+        """
+        Returns the shared VADER SentimentIntensityAnalyzer
+        """
+        if self._analyzer is None:
+            with self._lock:
+                if self._analyzer is None:
+                    from nltk.sentiment.vader import SentimentIntensityAnalyzer as SIA
+                    self._analyzer = SIA()
+        return self._analyzer
+
+    def stop_words(self):
+        """
+        Returns the english stopwords as a set so lookups are O(1)
+        """
+        if self._stop_words is None:
+            with self._lock:
+                if self._stop_words is None:
+                    from nltk.corpus import stopwords
+                    self._stop_words = frozenset(stopwords.words('english'))
+        return self._stop_words
+
+    def tokenizer(self):
+        """
+        Returns the shared word tokenizer used for the word bubbles
+        """
+        if self._tokenizer is None:
+            with self._lock:
+                if self._tokenizer is None:
+                    from nltk.tokenize import RegexpTokenizer
+                    self._tokenizer = RegexpTokenizer(r'\w+')
+        return self._tokenizer
+
+    def preload(self):
+        """
+        Loads everything up front, e.g. in the master process before gunicorn forks workers
+        """
+        self.analyzer()
+        self.stop_words()
+        self.tokenizer()
+
+    def remove_emoji(self, string):
+        return emoji_pattern.sub(r'', string)
+
+    def score(self, text):
+        """
+        Scores one text with VADER, the text is stored under 'headline'
+        """
+        pol_score = self.analyzer().polarity_scores(text)
+        pol_score['headline'] = text
+        return pol_score
+
+    def score_many(self, texts):
+        """
+        Scores each text with VADER and returns a list of polarity dicts in the same order,
+        each with the scored text stored under 'headline'. Large batches are scored on the
+        process pool in apis/analysis/batch.py
+        """
+        from apis.analysis.batch import score_batch
+        return score_batch("vader", texts)
+
+
+def label(compound):
+    """
+    1 for positive, -1 for negative and 0 for neutral compound scores
+    """
+    if compound > 0.2:
+        return 1
+    elif compound < -0.2:
+        return -1
+    return 0
+
+
+registry = AnalysisRegistry()
+
+
+def preload():
+    registry.preload()
+
+
+def remove_emoji(string):
+    return registry.remove_emoji(string)
+
+
+def score_many(texts):
+    return registry.score_many(texts)
+
@@ -0,0 +1,172 @@
+import os
+import re
+import threading
+from functools import lru_cache
+
+import settings
+
+"""
+Spelling correctors for George. TextBlob's corrector is accurate but takes seconds per paragraph,
+SymSpellCorrector gives similar corrections from a precomputed symmetric delete index over the same
+word list in microseconds per word. Every corrector remembers the words it has already corrected.
+"""
+
+WORD_PATTERN = re.compile(r"[A-Za-z]+")
+
+
+class Corrector:
+    """
+    Base corrector, corrects each word of a text with correct_word and keeps everything else
+    """
+    def __init__(self, cache_size=None):
+        if cache_size is None:
+            cache_size = settings.SPELLING_CACHE_SIZE
+        self.correct_word = lru_cache(maxsize=cache_size)(self._correct_word)
+
+    def _correct_word(self, word):
+        return word
+
+    def correct(self, text):
+        return WORD_PATTERN.sub(lambda match: match_case(match.group(), self.correct_word(match.group().lower())), text)
+
+
+class NoCorrector(Corrector):
+    """
+    Skips spelling correction
+    """
+    def correct(self, text):
+        return text
+
+
+class TextBlobCorrector(Corrector):
+    """
+    TextBlob's Norvig style corrector, one word at a time so results can be memoized
+    """
+    def _correct_word(self, word):
+        from textblob import Word
+        return str(Word(word).correct())
+
+
+class SymSpellCorrector(Corrector):
+    """
+    Symmetric delete corrector. Every dictionary word is indexed under each string that can be made
+    by deleting up to max_distance of its letters, so candidates for a misspelling are found by
+    generating the deletes of the misspelling and looking them up, instead of generating every edit
+    """
+    def __init__(self, words=None, max_distance=None, cache_size=None):
+        Corrector.__init__(self, cache_size)
+        if max_distance is None:
+            max_distance = settings.SPELLING_MAX_DISTANCE
+        self.max_distance = max_distance
+        self.words = words if words is not None else textblob_words()
+        self.index = {}
+        for word in self.words:
+            for delete in deletes(word, max_distance):
+                self.index.setdefault(delete, []).append(word)
+
+    def _correct_word(self, word):
+        if word in self.words:
+            return word
+        best = None
+        for delete in deletes(word, self.max_distance):
+            for candidate in self.index.get(delete, ()):
+                if abs(len(candidate) - len(word)) > self.max_distance:
+                    continue
+                distance = edit_distance(word, candidate)
+                if distance > self.max_distance:
+                    continue
+                # closest first, then most common
+                key = (distance, -self.words[candidate])
+                if best is None or key < best[0]:
+                    best = (key, candidate)
+        if best is None:
+            return word
+        return best[1]
+
+
+def deletes(word, max_distance):
+    """
+    word and every string made by deleting up to max_distance characters from it
+    """
+    results = {word}
+    edges = {word}
+    for _ in range(max_distance):
+        next_edges = set()
+        for value in edges:
+            if len(value) <= 1:
+                continue
+            for i in range(len(value)):
+                next_edges.add(value[:i] + value[i + 1:])
+        next_edges -= results
+        results |= next_edges
+        edges = next_edges
+    return results
+
+
+def edit_distance(a, b):
+    """
+    Damerau-Levenshtein distance (optimal string alignment) between a and b
+    """
+    previous_row = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous_row, row = previous_row, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+    return row[len(b)]
+
+
+def match_case(original, corrected):
+    if original.isupper() and len(original) > 1:
+        return corrected.upper()
+    if original[0].isupper():
+        return corrected[0].upper() + corrected[1:]
+    return corrected
+
+
+def textblob_words():
+    """
+    Word counts from the dictionary TextBlob's own corrector uses
+    """
+    import textblob.en
+    path = os.path.join(os.path.dirname(textblob.en.__file__), "en-spelling.txt")
+    words = {}
+    with open(path) as spelling_file:
+        for line in spelling_file:
+            if line.startswith(";;;"):
+                continue
+            parts = line.split()
+            if len(parts) == 2:
+                words[parts[0]] = int(parts[1])
+    return words
+
+
+_lock = threading.Lock()
+_correctors = {}
+
+
+def get_corrector(name=None):
+    """
+    Returns the shared corrector called name ("symspell", "textblob" or "none"), building it on
+    first use. Defaults to settings.GEORGE_CORRECTOR
+    """
+    if name is None:
+        name = settings.GEORGE_CORRECTOR
+    corrector = _correctors.get(name)
+    if corrector is None:
+        with _lock:
+            corrector = _correctors.get(name)
+            if corrector is None:
+                if name == "symspell":
+                    corrector = SymSpellCorrector()
+                elif name == "textblob":
+                    corrector = TextBlobCorrector()
+                elif name == "none":
+                    corrector = NoCorrector()
+                else:
+                    raise ValueError("Unknown spelling corrector {}".format(name))
+                _correctors[name] = corrector
+    return corrector
@@ -0,0 +1,55 @@
+import settings
+from apis.analysis.aggregator import SentimentAggregator
+from apis.analysis.dedupe import NearDuplicates
+from apis.analysis.registry import registry
+
+"""
+Scores posts one at a time as the provider yields them, for the NDJSON results stream.
+Records are dicts with a "type" of:
+    post     - one scored post
+    progress - running label counts and rating, every settings.STREAM_PROGRESS_EVERY posts
+    summary  - the final result, same fields as the non streaming response
+    error    - the provider failed part way through
+Only the running aggregate is kept, not the posts. A near-duplicate of an earlier post reuses that
+post's scores instead of being scored again.
+"""
+
+def stream_scores(headlines, positive_threshold, progress_every=None, budget=None):
+    """
+    Yields a post record per headline, progress records along the way and a summary at the end.
+    positive_threshold is the rating above which positive headlines are shown rather than negative.
+    If the provider ran under an IngestBudget its truncation metadata is added to the summary
+    """
+    if progress_every is None:
+        progress_every = settings.STREAM_PROGRESS_EVERY
+    aggregator = SentimentAggregator(positive_threshold)
+    duplicates = NearDuplicates() if settings.DEDUPE_ENABLED else None
+    cluster_scores = []
+
+    try:
+        for line in headlines:
+            new = True
+            if duplicates is None:
+                pol_score = registry.score(line)
+            else:
+                cluster, new = duplicates.add(line)
+                if new:
+                    cluster_scores.append(registry.score(line))
+                pol_score = dict(cluster_scores[cluster], headline=line)
+            pol_score['label'] = aggregator.add(pol_score, show=new)
+            pol_score['type'] = "post"
+            yield pol_score
+
+            if aggregator.total() % progress_every == 0:
+                progress = aggregator.progress()
+                progress['type'] = "progress"
+                yield progress
+    except Exception as e:
+        yield {'type': "error", 'status': "503", 'msg': "Entry unavailable"}
+        return
+
+    summary = aggregator.result()
+    summary['type'] = "summary"
+    if budget is not None and summary['status'] == "200":
+        summary.update(budget.metadata())
+    yield summary
@@ -0,0 +1,105 @@
+import heapq
+from collections import Counter
+
+import settings
+from apis.analysis.registry import registry
+
+"""
+Word frequency counts for the word bubble. Each post is tokenized once, stopwords are dropped
+with a set lookup and the counts can be merged with counts from other shards or time windows.
+"""
+
+_custom_stopwords = None
+
+
+def custom_stopwords():
+    """
+    Extra stopwords from settings.WORD_BUBBLE_STOPWORDS_FILE, read once
+    """
+    global _custom_stopwords
+    if _custom_stopwords is None:
+        words = set()
+        if settings.WORD_BUBBLE_STOPWORDS_FILE:
+            with open(settings.WORD_BUBBLE_STOPWORDS_FILE) as stopword_file:
+                words = {line.strip().lower() for line in stopword_file if line.strip()}
+        _custom_stopwords = frozenset(words)
+    return _custom_stopwords
+
+
+def tokenize(text):
+    """
+    Lower cased word tokens of text
+    """
+    return [t.lower() for t in registry.tokenizer().tokenize(text)]
+
+
+class WordBubble:
+    """
+    Term and document frequencies of words (and optionally n-grams) across posts
+    """
+    def __init__(self, ngrams=None, min_df=None, stop_words=None):
+        self.ngrams = ngrams or settings.WORD_BUBBLE_NGRAMS
+        self.min_df = min_df or settings.WORD_BUBBLE_MIN_DF
+        if stop_words is None:
+            stop_words = registry.stop_words() | custom_stopwords()
+        self.stop_words = stop_words
+        self.term_counts = Counter()
+        self.doc_counts = Counter()
+        self.documents = 0
+
+    def terms(self, tokens):
+        """
+        The words and n-grams of a tokenized post, with stopwords removed
+        """
+        words = [t for t in tokens if t not in self.stop_words]
+        if self.ngrams == (1,):
+            return words
+        terms = []
+        for n in self.ngrams:
+            for i in range(len(words) - n + 1):
+                terms.append(" ".join(words[i:i + n]))
+        return terms
+
+    def add_tokens(self, tokens, weight=1):
+        terms = self.terms(tokens)
+        if weight == 1:
+            self.term_counts.update(terms)
+        else:
+            for term in terms:
+                self.term_counts[term] += weight
+        if self.min_df > 1:
+            for term in set(terms):
+                self.doc_counts[term] += weight
+        self.documents += weight
+
+    def add(self, text, weight=1):
+        self.add_tokens(tokenize(text), weight)
+
+    def merge(self, other):
+        """
+        Adds the counts of another WordBubble to this one
+        """
+        self.term_counts.update(other.term_counts)
+        self.doc_counts.update(other.doc_counts)
+        self.documents += other.documents
+        return self
+
+    def top(self, k):
+        """
+        The k most frequent terms as (term, count) pairs, most frequent first
+        """
+        items = self.term_counts.items()
+        if self.min_df > 1:
+            items = ((term, count) for term, count in items if self.doc_counts[term] >= self.min_df)
+        return heapq.nlargest(k, items, key=lambda item: item[1])
+
+    def to_dict(self):
+        return {'term_counts': dict(self.term_counts), 'doc_counts': dict(self.doc_counts), 'documents': self.documents}
+
+    @classmethod
+    def from_dict(cls, data, **kwargs):
+        bubble = cls(**kwargs)
+        bubble.term_counts.update(data['term_counts'])
+        bubble.doc_counts.update(data['doc_counts'])
+        bubble.documents = data['documents']
+        return bubble
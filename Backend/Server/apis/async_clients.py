@@ -0,0 +1,131 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+import settings
+import tracing
+from apis import resilience
+
+"""
+Non-blocking counterpart of apis/clients.py for the async server (async_app.py). One aiohttp
+session per event loop keeps a connection pool per host, and every call gets the same per upstream
+timeouts, circuit breaker and hedging as the blocking clients (see apis/resilience.py).
+"""
+
+_sessions = {}
+
+
+class Response:
+    """
+    The parts of a requests.Response the providers use, so the same parsing code works on both
+    """
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def session():
+    """
+    Returns the aiohttp session for the running event loop, creating it on first use
+    """
+    loop = asyncio.get_running_loop()
+    client = _sessions.get(loop)
+    if client is None or client.closed:
+        connector = aiohttp.TCPConnector(limit=settings.ASYNC_HTTP_LIMIT, limit_per_host=settings.ASYNC_HTTP_LIMIT_PER_HOST)
+        timeout = aiohttp.ClientTimeout(sock_connect=settings.HTTP_CONNECT_TIMEOUT, sock_read=settings.HTTP_READ_TIMEOUT)
+        client = _sessions[loop] = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return client
+
+
+async def close():
+    """
+    Closes the running loop's session, e.g. on server shutdown
+    """
+    client = _sessions.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+async def get(url, upstream=None, params=None, headers=None):
+    """
+    GET through the loop's shared session. The body is read before returning and the latency is
+    recorded under upstream, or the url's host name. Raises resilience.UpstreamUnavailable while
+    the upstream's circuit is open
+    """
+    if upstream is None:
+        upstream = urlparse(url).hostname
+    guard = resilience.upstream(upstream)
+    probe = guard.check()
+    try:
+        delay = guard.hedge_delay()
+        if delay is None:
+            return await attempt(guard, url, params, headers)
+        return await hedged_get(guard, delay, url, params, headers)
+    except asyncio.CancelledError:
+        # e.g. a deadline or the client going away, the probe said nothing about the upstream
+        if probe:
+            guard.breaker.release_probe()
+        raise
+
+
+async def attempt(guard, url, params, headers):
+    timeout = aiohttp.ClientTimeout(sock_connect=guard.connect_timeout, sock_read=guard.read_timeout)
+    start = time.perf_counter()
+    try:
+        async with session().get(url, params=params, headers=headers, timeout=timeout) as response:
+            content = await response.read()
+    except asyncio.CancelledError:
+        # the other request of a hedged pair answered first, says nothing about the upstream
+        raise
+    except Exception:
+        observe(guard, time.perf_counter() - start, "error")
+        raise
+    observe(guard, time.perf_counter() - start, response.status)
+    return Response(response.status, response.headers, content)
+
+
+def observe(guard, seconds, status):
+    tracing.observe_upstream(guard.name, seconds, status)
+    guard.record(seconds, status)
+
+
+async def hedged_get(guard, delay, url, params, headers):
+    """
+    Sends the GET and, if it hasn't answered after delay seconds, an identical one. Returns
+    whichever answers first and cancels the other
+    """
+    first = asyncio.ensure_future(attempt(guard, url, params, headers))
+    pending = {first}
+    error = None
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+        tracing.count_hedge(guard.name, "sent")
+        second = asyncio.ensure_future(attempt(guard, url, params, headers))
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    # the other request may still answer
+                    error = task.exception()
+                    continue
+                if task is second:
+                    tracing.count_hedge(guard.name, "won")
+                return task.result()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
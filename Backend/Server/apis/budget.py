@@ -0,0 +1,90 @@
+import math
+import time
+
+"""
+Limits how much a provider ingests for one search. When the budget runs out the provider stops
+and returns what it has so far, marked as truncated.
+"""
+
+class IngestBudget:
+    """
+    Post, page and wall clock limits for one ingestion run
+    """
+    def __init__(self, max_items, max_pages, deadline, page_size=100):
+        self.max_items = max_items
+        self.max_pages = max_pages
+        self.deadline = deadline
+        self.page_size = page_size
+        self.started = time.monotonic()
+        self.items = 0
+        self.pages = 0
+        self.truncated = False
+        self.reason = None
+        # cursor of the newest post seen, for incremental searches
+        self.newest = None
+
+    def item_limit(self):
+        """
+        Most items that can be read without going over the item or page limits
+        """
+        return min(self.max_items, self.max_pages * self.page_size)
+
+    def remaining_time(self):
+        return self.deadline - (time.monotonic() - self.started)
+
+    def stop(self, reason):
+        self.truncated = True
+        if self.reason is None:
+            self.reason = reason
+        return False
+
+    def at_limit(self):
+        """
+        True, and marks the run as truncated, once the item or page limit has been reached
+        """
+        if self.items >= self.item_limit():
+            self.stop("max_pages" if self.max_pages * self.page_size < self.max_items else "max_posts")
+            return True
+        return False
+
+    def take_item(self):
+        """
+        Counts one more item. Returns False, and marks the run as truncated, if the item is over
+        budget and should not be used
+        """
+        if self.at_limit():
+            return False
+        if self.remaining_time() <= 0:
+            return self.stop("deadline")
+        self.items += 1
+        self.pages = max(self.pages, math.ceil(self.items / self.page_size))
+        return True
+
+    def at_page_limit(self):
+        """
+        True, and marks the run as truncated, once max_pages pages have been fetched
+        """
+        if self.pages >= self.max_pages:
+            self.stop("max_pages")
+            return True
+        return False
+
+    def take_page(self):
+        """
+        Counts one more page request for providers that page explicitly
+        """
+        if self.at_page_limit():
+            return False
+        if self.remaining_time() <= 0:
+            return self.stop("deadline")
+        self.pages += 1
+        return True
+
+    def metadata(self):
+        return {
+            'truncated': self.truncated,
+            'truncated_reason': self.reason,
+            'posts_scanned': self.items,
+            'pages_fetched': self.pages,
+            'seconds': round(time.monotonic() - self.started, 3),
+        }
@@ -0,0 +1,185 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import settings
+import tracing
+from apis import resilience
+
+"""
+Shared upstream clients. Every provider goes through these so connections are pooled and kept
+alive per host instead of doing a new TCP + TLS handshake on every call, and so every call has a
+timeout and goes through its upstream's circuit breaker (see apis/resilience.py). The reddit
+client (and its OAuth token) is also reused across requests.
+"""
+
+_lock = threading.Lock()
+_session = None
+_hedge_executor = None
+_reddit_clients = {}
+
+
+class GuardedAdapter(HTTPAdapter):
+    """
+    Connection pool adapter that records every request's latency under an upstream and sends
+    it through that upstream's circuit breaker, for sessions used by libraries (praw) that don't
+    go through get()
+    """
+    def __init__(self, upstream, **kwargs):
+        self.guard = resilience.upstream(upstream)
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        probe = self.guard.check()
+        start = time.perf_counter()
+        try:
+            try:
+                response = super().send(request, **kwargs)
+            except Exception:
+                observe(self.guard, time.perf_counter() - start, "error")
+                raise
+            observe(self.guard, time.perf_counter() - start, response.status_code)
+            return response
+        finally:
+            if probe:
+                self.guard.breaker.release_probe()
+
+
+def pooled_session(upstream=None):
+    """
+    Returns a new requests session with a keep-alive connection pool per host. If upstream is
+    given every request is recorded and guarded under that name, see GuardedAdapter
+    """
+    session = requests.Session()
+    pool = dict(pool_connections=settings.HTTP_POOL_CONNECTIONS, pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                max_retries=settings.HTTP_RETRIES)
+    if upstream is not None:
+        adapter = GuardedAdapter(upstream, **pool)
+    else:
+        adapter = HTTPAdapter(**pool)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def session():
+    """
+    Returns the process wide session shared by the amazon, imdb and twitter providers
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = pooled_session()
+    return _session
+
+
+def hedge_executor():
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=settings.HEDGE_WORKERS, thread_name_prefix="pov-hedge")
+    return _hedge_executor
+
+
+def observe(guard, seconds, status):
+    tracing.observe_upstream(guard.name, seconds, status)
+    guard.record(seconds, status)
+
+
+def get(url, upstream=None, **kwargs):
+    """
+    requests.get through the shared session, with the upstream's timeouts unless one is passed.
+    Raises resilience.UpstreamUnavailable while the upstream's circuit is open, and sends a
+    second request if the upstream is hedged and the first is slower than usual. The latency is
+    recorded under upstream, or the url's host name
+    """
+    if upstream is None:
+        upstream = urlparse(url).hostname
+    guard = resilience.upstream(upstream)
+    kwargs.setdefault("timeout", guard.timeout())
+    probe = guard.check()
+    try:
+        delay = guard.hedge_delay()
+        if delay is None:
+            return attempt(guard, url, **kwargs)
+        return hedged_get(guard, delay, url, **kwargs)
+    finally:
+        # the outcome has been recorded by now if there was one, if not (e.g. the thread was
+        # interrupted) the probe said nothing about the upstream and another call may probe
+        if probe:
+            guard.breaker.release_probe()
+
+
+def attempt(guard, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = session().get(url, **kwargs)
+    except Exception:
+        observe(guard, time.perf_counter() - start, "error")
+        raise
+    observe(guard, time.perf_counter() - start, response.status_code)
+    return response
+
+
+def hedged_get(guard, delay, url, **kwargs):
+    """
+    Sends the GET on the calling thread and, if it hasn't answered after delay seconds, an
+    identical one from the hedge pool. The delay runs from when the first GET was sent, so a busy
+    pool holds hedges back instead of firing them early, and a hedge that only gets a thread after
+    the first GET has answered isn't sent. The first GET can't be abandoned once it's blocking, so
+    the hedge's answer is used when the first GET fails and the slower one is left to finish
+    """
+    answered = threading.Event()
+    sent_at = time.perf_counter()
+
+    def hedge():
+        if answered.wait(max(0, delay - (time.perf_counter() - sent_at))):
+            return None
+        tracing.count_hedge(guard.name, "sent")
+        return attempt(guard, url, **kwargs)
+
+    second = hedge_executor().submit(tracing.wrap(hedge))
+    try:
+        return attempt(guard, url, **kwargs)
+    except Exception:
+        answered.set()
+        if second.cancel():
+            raise
+        try:
+            response = second.result()
+        except Exception:
+            response = None
+        if response is None:
+            raise
+        tracing.count_hedge(guard.name, "won")
+        return response
+    finally:
+        answered.set()
+        second.cancel()
+
+
+def reddit_client(client_id, client_secret, user_agent):
+    """
+    Returns a praw.Reddit client for the given keys, creating it on first use. praw keeps the
+    OAuth token on the client so reusing it saves a token request per search
+    """
+    key = (client_id, client_secret, user_agent)
+    client = _reddit_clients.get(key)
+    if client is None:
+        with _lock:
+            client = _reddit_clients.get(key)
+            if client is None:
+                import praw
+                # praw sets its own headers on the session so it gets its own pool
+                client = praw.Reddit(client_id=client_id, client_secret=client_secret, user_agent=user_agent,
+                                     requestor_kwargs={"session": pooled_session("reddit")},
+                                     timeout=int(resilience.upstream("reddit").read_timeout),
+                                     oauth_url=settings.REDDIT_OAUTH_URL, reddit_url=settings.REDDIT_URL)
+                _reddit_clients[key] = client
+    return client
@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import settings
+import tracing
+
+"""
+Runs the upstream calls of a provider as a small dependency graph. A step starts as soon as the
+steps it needs have finished, and steps that don't depend on each other run at the same time on
+a thread pool shared by every provider.
+"""
+
+_lock = threading.Lock()
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.FETCH_WORKERS, thread_name_prefix="pov-fetch")
+    return _executor
+
+
+class FetchGraph:
+    """
+    Named fetch steps with dependencies. Each step is called with the results of the steps it
+    depends on, in the order they were listed, e.g.
+
+        graph = FetchGraph()
+        graph.add("id", get_id)
+        graph.add("rating", get_rating, "id")
+        graph.add("reviews", get_reviews, "id")
+        results = graph.run()
+    """
+    def __init__(self, pool=None):
+        self.pool = pool
+        self.steps = {}
+
+    def add(self, name, func, *depends_on):
+        for dep in depends_on:
+            if dep not in self.steps:
+                raise ValueError("Step {} depends on unknown step {}".format(name, dep))
+        self.steps[name] = (func, depends_on)
+        return self
+
+    def run(self):
+        """
+        Runs every step and returns a dict of step name to result. Exceptions raised by a step
+        are raised here
+        """
+        pool = self.pool or executor()
+        results = {}
+        pending = dict(self.steps)
+        running = {}
+        while pending or running:
+            ready = [name for name, (func, deps) in pending.items() if all(dep in results for dep in deps)]
+            if len(ready) == 1 and not running:
+                # nothing to run alongside it, so skip the thread hop
+                name = ready[0]
+                func, deps = pending.pop(name)
+                results[name] = func(*[results[dep] for dep in deps])
+                continue
+            for name in ready:
+                func, deps = pending.pop(name)
+                running[pool.submit(tracing.wrap(func), *[results[dep] for dep in deps])] = name
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+        return results
@@ -1,43 +1,114 @@
-import requests
+import asyncio
 import json
+import settings
+import tracing
+from apis import clients
+from apis.fetch import FetchGraph
 
 """
 Uses data from https://rapidapi.com/apidojo/api/imdb8/
 """
 
+def review_titles(response_json):
+    """
+    Get the review titles from a reviews json
+    """
+    i = 0
+    reviews = []
+    while i < len(response_json['reviews']):
+        reviews.append(response_json["reviews"][i]["reviewTitle"])
+        i += 1
+    return reviews
+
+def imdb_url(kind, value):
+    """
+    Url of the "id", "rating" or "review" endpoint for a search term or movie id
+    """
+    return "{}/imdb/{}/{}".format(settings.IMDB_BASE_URL, kind, str(value))
+
+def movie_id(data):
+    """
+    The movie id from id search json, "/title/tt1160419/" -> "tt1160419"
+    """
+    return data["id"][7:-1]
+
+def read_movie_id(response):
+    """
+    The movie id from an id search response, or None if nothing was found
+    """
+    response_type = response.headers
+    if response_type["Content-Type"] == 'application/json':
+        #Get movie id from json
+        return movie_id(response.json())
+    else:
+        return None
+
 class ImdbData:
     """
     Get movie rating from inputted search term. See Amazon Class for full commments
     *Currently requests to a custom server due to API payment issues*
     """
-    def __init__(self, term):
+    def __init__(self, term, fetched=None):
+        """
+        fetched can be passed to build the result from already downloaded json instead of
+        calling the api, see fetch() for its keys
+        """
         self.term = term
         self.api_response = ""
-        self.id = self.get_movie_id()
-        self.rating = self.get_rating()
-        self.rating_count = self.get_rating_count()
-        self.top_rank = self.get_top_rank()
-        self.reviews = self.get_reviews()
-        self.result = self.final_result()
+        if fetched is None:
+            with tracing.span("fetch"):
+                fetched = self.fetch()
+        with tracing.span("parse"):
+            self.id = fetched["id"]
+            self.api_response = fetched["ratings"]
+            self.rating = self.get_rating()
+            self.rating_count = self.get_rating_count()
+            self.top_rank = self.get_top_rank()
+            self.reviews = fetched["reviews"]
+            self.result = self.final_result()
+        tracing.count_posts("imdb", len(self.reviews or []))
 
     def getResult(self):
         return self.result
 
+    def fetch(self):
+        """
+        Fetches the id and then the rating json and review titles at the same time, as they
+        only need the id
+        """
+        graph = FetchGraph()
+        graph.add("id", self.get_movie_id)
+        graph.add("ratings", self.fetch_ratings, "id")
+        graph.add("reviews", self.get_reviews, "id")
+        return graph.run()
+
+    @classmethod
+    async def create_async(cls, term):
+        """
+        Builds the ImdbData for term without blocking the event loop, for async_app.py
+        """
+        from apis import async_clients
+        with tracing.span("fetch"):
+            id = read_movie_id(await async_clients.get(imdb_url("id", term), upstream="imdb"))
+            ratings = reviews = None
+            if id is not None:
+                ratings, reviews = await asyncio.gather(async_clients.get(imdb_url("rating", id), upstream="imdb"),
+                                                        async_clients.get(imdb_url("review", id), upstream="imdb"))
+                ratings, reviews = ratings.json(), review_titles(reviews.json())
+        return cls(term, fetched={"id": id, "ratings": ratings, "reviews": reviews})
+
     def get_movie_id(self):
-        response = requests.get("https://louissullivcs.pythonanywhere.com/imdb/id/{}".format(str(self.term)))
-        response_type = response.headers
-        if response_type["Content-Type"] == 'application/json':
-            data = response.json()
-            #Get movie id from json
-            id = data["id"]
-            return id[7:-1]
+        return read_movie_id(clients.get(imdb_url("id", self.term), upstream="imdb"))
+    
+    def fetch_ratings(self, id):
+        if id != None:
+            response = clients.get(imdb_url("rating", id), upstream="imdb")
+            return response.json()
         else:
             return None
-    
+
     def get_rating(self):
         if self.id != None:
-            response = requests.get("https://louissullivcs.pythonanywhere.com/imdb/rating/{}".format(str(self.id)))
-            self.api_response = response.json()
             #Get rating from json
             reviews = self.api_response["rating"]
             result = str(float(reviews) * 10)
@@ -59,16 +130,10 @@ class ImdbData:
         else:
             return None
 
-    def get_reviews(self):
-        if self.top_rank != None:
-            response = requests.get("https://louissullivcs.pythonanywhere.com/imdb/review/{}".format(str("tt1160419")))
-            response_json = response.json()
-            i = 0
-            reviews = []
-            while i < len(response_json['reviews']):
-                reviews.append(response_json["reviews"][i]["reviewTitle"])
-                i += 1
-            return reviews
+    def get_reviews(self, id):
+        if id != None:
+            response = clients.get(imdb_url("review", id), upstream="imdb")
+            return review_titles(response.json())
         else:
             return None
     
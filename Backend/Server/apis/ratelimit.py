@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+
+"""
+Token bucket rate limiter shared by every request to an upstream. It also follows the quota the
+upstream reports in its x-rate-limit-* headers, so once the upstream says the window is used up
+nobody calls it again until the window resets.
+"""
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average with bursts of up to capacity
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # monotonic time before which the upstream has told us not to call it
+        self.blocked_until = 0
+        self.remaining = None
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """
+        Seconds until a request could be made
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0, self.blocked_until - now)
+            if self.tokens < 1:
+                wait = max(wait, (1 - self.tokens) / self.rate)
+            return wait
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available now. Returns (whether it was taken, seconds until one
+        could be)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self.blocked_until and self.tokens >= 1:
+                self.tokens -= 1
+                return True, 0
+            return False, max(self.blocked_until - now, (1 - self.tokens) / self.rate if self.tokens < 1 else 0)
+
+    def acquire(self, timeout=0):
+        """
+        Takes a token, waiting up to timeout seconds for one. Returns False if none was available
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            taken, wait = self.try_acquire()
+            if taken:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    async def acquire_async(self, timeout=0):
+        """
+        acquire() for the event loop, waits without blocking it
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            taken, wait = self.try_acquire()
+            if taken:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers):
+        """
+        Reads x-rate-limit-remaining and x-rate-limit-reset (epoch seconds) from a response
+        """
+        remaining = headers.get("x-rate-limit-remaining")
+        reset = headers.get("x-rate-limit-reset")
+        if remaining is None:
+            return
+        with self._lock:
+            self.remaining = int(remaining)
+            if self.remaining <= 0 and reset is not None:
+                self._block_for(float(reset) - time.time())
+
+    def block_for(self, seconds):
+        """
+        Stops any request for the next seconds, e.g. after a 429
+        """
+        with self._lock:
+            self._block_for(seconds)
+
+    def _block_for(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + max(0, seconds))
+
+    def stats(self):
+        with self._lock:
+            return {"tokens": round(self.tokens, 2), "remaining": self.remaining,
+                    "blocked_for": round(max(0, self.blocked_until - time.monotonic()), 1)}
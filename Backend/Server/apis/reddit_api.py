@@ -1,22 +1,15 @@
-import json
-# from turtle import up, update
-from nltk.tokenize import word_tokenize, RegexpTokenizer
-from nltk.corpus import stopwords
-from pprint import pprint
-import pandas as pd
-import nltk
-from nltk.sentiment.vader import SentimentIntensityAnalyzer as SIA
-import praw
+import settings
+import tracing
+from store import record_posts
+from apis import clients
+from apis.budget import IngestBudget
 import re
-from keys import *
-
-def remove_emoji(string):
-    emoji_pattern = re.compile("["
-    u"\U0001F600-\U0001F64F" u"\U0001F680-\U0001F6FF" u"\U0001F1E0-\U0001F1FF" u"\U00002500-\U00002BEF"  
-    u"\U00002702-\U000027B0"u"\U00002702-\U000027B0"u"\U000024C2-\U0001F251"u"\U0001f926-\U0001f937"
-    u"\U00010000-\U0010ffff"u"\u2640-\u2642"u"\u2600-\u2B55"u"\u200d"u"\u23cf"u"\u23e9"u"\u231a"
-    u"\ufe0f"u"\u3030""]+", flags=re.UNICODE)
-    return emoji_pattern.sub(r'', string)
+import time
+from apis.analysis.aggregator import SentimentAggregator
+from apis.analysis.cursors import cursors
+from apis.analysis.dedupe import collapse
+from apis.analysis.registry import remove_emoji, score_many
+from apis.analysis.stream import stream_scores
 
 def filter_post(post):
     newline_remove = post.replace("\n", " ")
@@ -28,13 +21,10 @@ def filter_post(post):
     string_decode = " ".join(string_decode.split())
     return string_decode
 
-def reddit_search(searchterm, category, id, secret, user):
-    sia = SIA()
-    results = []
-    reddit = praw.Reddit(client_id=id, client_secret=secret, user_agent=user)
-    headlines = set()
-    new_json = {}
-
+def get_subreddit(category):
+    """
+    Returns the subreddit searched for a category
+    """
     if category == "game" or category == "Game":
         subreddit = "gaming"
     elif category == "Sport" or category == "sport":
@@ -43,103 +33,102 @@ def reddit_search(searchterm, category, id, secret, user):
         subreddit = "travel"
     elif category == "music" or category == "Music":
         subreddit = "Music"
-
+    elif category == "movie" or category == "Movie":
+        subreddit = "movies"
+    elif category == "politics" or category == "Politics":
+        subreddit = "politics"
+    elif category == "celebrity" or category == "Celebrity":
+        subreddit = "entertainment"
+    else:
+        subreddit = None
+    return subreddit
+
+def new_budget():
+    return IngestBudget(settings.REDDIT_MAX_POSTS, settings.REDDIT_MAX_PAGES, settings.REDDIT_DEADLINE)
+
+def reddit_headlines(searchterm, category, id, secret, user, budget=None, since=None, posts=None):
+    """
+    Yields each unique cleaned submission title as it is fetched, until the budget runs out.
+    since is the cursor of a previous search, {'fullname', 'created'} of its newest submission,
+    to only fetch newer submissions. The newest submission's cursor is saved on the budget. If
+    posts is given each title is mapped in it to its submission's (fullname, created time)
+    """
+    if budget is None:
+        budget = new_budget()
+    reddit = clients.reddit_client(id, secret, user)
+    subreddit = reddit.subreddit(get_subreddit(category))
+    if since is None:
+        resp = subreddit.search(searchterm,limit=budget.item_limit())
+    else:
+        # newest first, so we can stop at the first submission we have already seen
+        resp = subreddit.search(searchterm,sort="new",limit=budget.item_limit())
+    seen = set()
+    clean_seconds = 0.0
     try:
-        subreddit = reddit.subreddit(subreddit)
-        resp = subreddit.search(searchterm,limit=None) # num of searches returned
-        json_out = {}
-
         for submission in resp:
+            if since is not None and (submission.fullname == since['fullname'] or submission.created_utc <= since['created']):
+                break
+            if not budget.take_item():
+                break
+            if budget.newest is None or submission.created_utc > budget.newest['created']:
+                budget.newest = {'fullname': submission.fullname, 'created': submission.created_utc}
+            start = time.perf_counter()
             post = remove_emoji(submission.title)
             filtered_post = filter_post(post)
-            headlines.add(filtered_post)
-
-        for line in headlines:
-            pol_score = sia.polarity_scores(line)
-            pol_score['headline'] = line
-            results.append(pol_score)
-
-        df = pd.DataFrame.from_records(results)
-        df['label']=0
-        df.loc[df['compound']> 0.2, 'label'] = 1
-        df.loc[df['compound']< -0.2, 'label'] = -1
-        df.head()
-        df2 = df[['headline', 'label']]
-
-        json_out.update({'Positive headlines': list(df[df['label'] == 1].headline)[:5]})
-        json_out.update({'Negative headlines': list(df[df['label'] == -1].headline)[:5]})
-
-        headline_count = df.label.value_counts()
-        json_out.update({'Headline count': headline_count.to_json()})
-
-        headline_count_per = df.label.value_counts(normalize=True)
-        json_out.update({'Headline count %': headline_count_per.to_json()})
-
-        tokenizer = RegexpTokenizer(r'\w+')
-        stop_words = stopwords.words('english')
-
-        # word distro
-        def process_text(headlines):
-            tokens = []
-            for line in headlines:
-                toks = tokenizer.tokenize(line)
-                toks = [t.lower() for t in toks if t.lower() not in stop_words]
-                tokens.extend(toks)
-            return tokens
-
-        pos_lines = list(df[df.label == 1].headline)
-        pos_tokens = process_text(pos_lines)
-        pos_freq = nltk.FreqDist(pos_tokens)
-        json_out.update({'Positive word distro': pos_freq.most_common(20)})
-
-        neg_lines = list(df2[df2.label == -1].headline)
-        neg_tokens = process_text(neg_lines)
-        neg_freq = nltk.FreqDist(neg_tokens)
-        json_out.update({'Negative word distro': neg_freq.most_common(20)})
-
-        dict_dump = json_out
-
-        # Status code 
-        if len(dict_dump) > 2:
-            new_json.update({'status': "200"})
-
-            # Total reviews
-            count_str = dict_dump["Headline count"]
-            count = json.loads(count_str)
-            total_count = 0
-            for i, val in count.items():
-                total_count += val
-            new_json.update({'total_reviews': total_count})
-
-            # Rating
-            ratings_str = dict_dump["Headline count %"]
-            ratings = json.loads(ratings_str)
-            result_rating = 0
-            for i, val in ratings.items():
-                if i == "0" or i == "1":
-                    result_rating += val
-            result_rating = int(float(result_rating) * 100)
-            new_json.update({'rating': str(result_rating)})
-
-            # Comments and Word Bubble
-            if result_rating > 50:
-                comments = dict_dump["Positive headlines"]
-                new_json.update({'reviews': comments})
-                word_bubble = dict_dump["Positive word distro"]
-                new_json.update({'word_bubble': word_bubble})
-            else:
-                comments = dict_dump["Negative headlines"]
-                new_json.update({'reviews': comments})
-                word_bubble = dict_dump["Negative word distro"]
-                new_json.update({'word_bubble': word_bubble})
-        else:
-            new_json.update({'status': "503"})
-            new_json.update({"msg": "Entry unavailable"})
+            clean_seconds += time.perf_counter() - start
+            if filtered_post not in seen:
+                seen.add(filtered_post)
+                if posts is not None:
+                    posts[filtered_post] = (submission.fullname, submission.created_utc)
+                yield filtered_post
+    finally:
+        tracing.record("clean", clean_seconds)
+    # praw stops at the limit, so reaching it means there were probably more results
+    budget.at_limit()
+
+def reddit_stream(searchterm, category, id, secret, user):
+    """
+    Streaming version of reddit_search, see apis/analysis/stream.py
+    """
+    budget = new_budget()
+    return stream_scores(reddit_headlines(searchterm, category, id, secret, user, budget), 50, budget=budget)
 
+def reddit_search(searchterm, category, id, secret, user):
+    """
+    Scores the submissions for the search term. If the term was searched recently only newer
+    submissions are fetched and merged into its saved aggregate
+    """
+    try:
+        state = cursors.get("reddit", searchterm, category)
+        since = state.cursor if state is not None else None
+        budget = new_budget()
+        aggregator = SentimentAggregator(50)
+        posts = {}
+        with tracing.span("fetch"):
+            headlines = list(reddit_headlines(searchterm, category, id, secret, user, budget, since, posts))
+        tracing.count_posts("reddit", len(headlines))
+        # near-duplicates are scored once and counted once per post
+        with tracing.span("dedupe"):
+            clusters = collapse(headlines)
+        with tracing.span("score"):
+            scored = score_many([text for text, size in clusters])
+        with tracing.span("aggregate"):
+            for pol_score, (text, size) in zip(scored, clusters):
+                pol_score['label'] = aggregator.add(pol_score, size)
+                pol_score['weight'] = size
+            if state is not None:
+                aggregator.merge(state.aggregator)
+        record_posts(searchterm, category, "reddit", scored, posts)
+        if budget.newest is not None or state is not None:
+            cursors.save("reddit", searchterm, category, budget.newest or since, aggregator, state)
+        new_json = aggregator.result()
+        if new_json['status'] == "200":
+            new_json.update(budget.metadata())
+            new_json.update({'incremental': state is not None})
     except Exception as e:
-        new_json.update({'status': "503"})
-        new_json.update({"msg": "Entry unavailable"})
+        new_json = {'status': "503", "msg": "Entry unavailable"}
     return(new_json)
 
 if __name__ == "__main__":
+    from keys import *
     print(reddit_search("adele", "music", client_id(), client_secret(), user_agent()))
@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import deque
+
+import settings
+import tracing
+
+"""
+Per upstream health for apis/clients.py and apis/async_clients.py. Each upstream ("amazon",
+"imdb", "twitter", "reddit" or a host name) has its own timeouts, a window of recent latencies
+that decides when a slow GET is hedged with a second identical one, and a circuit breaker. After
+BREAKER_FAILURES failures in a row (errors, timeouts and 5xx responses) the breaker opens and
+calls fail straight away with UpstreamUnavailable instead of waiting on an upstream that is down.
+After BREAKER_RESET seconds one call is let through as a probe, and its outcome closes or reopens
+the breaker. A probe that is cancelled gives its slot back, and one that hasn't reported after
+another BREAKER_RESET seconds is given up on.
+"""
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_lock = threading.Lock()
+_upstreams = {}
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open
+    """
+    def __init__(self, upstream):
+        super().__init__("{} is unavailable, circuit open".format(upstream))
+        self.upstream = upstream
+
+
+class LatencyWindow:
+    """
+    The last size latencies of an upstream's successful calls
+    """
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._values = deque(maxlen=size)
+
+    def add(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, pct, min_samples=1):
+        """
+        The pct percentile of the window, or None with fewer than min_samples values
+        """
+        with self._lock:
+            values = sorted(self._values)
+        if not values or len(values) < min_samples:
+            return None
+        return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class CircuitBreaker:
+    """
+    closed -> open after failure_threshold consecutive failures, open -> half_open after
+    reset_timeout seconds, half_open -> closed or open on the outcome of a single probe call
+    """
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+
+    def allow(self):
+        """
+        Returns True if a call may go ahead, "probe" if it is the single probe call allowed in
+        half_open and False if it may not
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+            if self._probing and now - self._probe_started < self.reset_timeout:
+                return False
+            self._probing = True
+            self._probe_started = now
+            return "probe"
+
+    def release_probe(self):
+        """
+        Lets another call probe, for a probe that ended without an outcome (e.g. it was cancelled)
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            changed = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+        if changed:
+            tracing.circuit_state(self.name, False)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            opened = self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold)
+            if opened:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+        if opened:
+            tracing.circuit_state(self.name, True)
+
+    def is_open(self):
+        with self._lock:
+            return self.state != CLOSED
+
+
+class Upstream:
+    """
+    Timeouts, latency window and circuit breaker for one upstream
+    """
+    def __init__(self, name):
+        self.name = name
+        self.connect_timeout = settings.HTTP_CONNECT_TIMEOUT
+        self.read_timeout = settings.UPSTREAM_READ_TIMEOUTS.get(name, settings.HTTP_READ_TIMEOUT)
+        self.hedged = name in settings.HEDGE_UPSTREAMS
+        self.latencies = LatencyWindow(settings.LATENCY_WINDOW)
+        self.breaker = CircuitBreaker(name, settings.BREAKER_FAILURES, settings.BREAKER_RESET)
+
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def check(self):
+        """
+        Raises UpstreamUnavailable if the breaker is open. Returns True if the call is the
+        breaker's half_open probe, which must be released if it ends without recording an outcome
+        """
+        if not settings.BREAKER_ENABLED:
+            return False
+        allowed = self.breaker.allow()
+        if not allowed:
+            tracing.count_rejected(self.name)
+            raise UpstreamUnavailable(self.name)
+        return allowed == "probe"
+
+    def record(self, seconds, status):
+        """
+        Records the outcome of one call. status is the http status code or "error"
+        """
+        if status == "error" or status >= 500:
+            self.breaker.record_failure()
+            return
+        self.breaker.record_success()
+        self.latencies.add(seconds)
+
+    def hedge_delay(self):
+        """
+        Seconds to wait for a GET before sending a second one, or None if this upstream isn't
+        hedged or there aren't enough latencies yet to know what slow is
+        """
+        if not self.hedged:
+            return None
+        delay = self.latencies.percentile(settings.HEDGE_PERCENTILE, settings.HEDGE_MIN_SAMPLES)
+        if delay is None:
+            return None
+        return max(delay, settings.HEDGE_MIN_DELAY)
+
+    def healthy(self):
+        return not self.breaker.is_open()
+
+
+def upstream(name):
+    """
+    Returns the Upstream for name, creating it on first use
+    """
+    guard = _upstreams.get(name)
+    if guard is None:
+        with _lock:
+            guard = _upstreams.get(name)
+            if guard is None:
+                guard = _upstreams[name] = Upstream(name)
+    return guard
+
+
+def healthy(names):
+    """
+    True unless the breaker of any of the named upstreams is open
+    """
+    return all(upstream(name).healthy() for name in names)
+
+
+def stats():
+    with _lock:
+        guards = list(_upstreams.values())
+    return {guard.name: {"state": guard.breaker.state, "failures": guard.breaker.failures,
+                         "hedge_delay": guard.hedge_delay()} for guard in guards}
@@ -1,40 +1,78 @@
-from re import sub
-import requests
-import json
-from nltk.tokenize import word_tokenize, RegexpTokenizer
-from nltk.corpus import stopwords
-from nltk.sentiment.vader import SentimentIntensityAnalyzer as SIA
-import nltk
+import settings
+import tracing
+from store import record_posts
+import asyncio
 import re
-from pprint import pprint
-import pandas as pd
+import time
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from apis import clients
+from apis.budget import IngestBudget
+from apis.ratelimit import TokenBucket
+from apis.analysis.aggregator import SentimentAggregator
+from apis.analysis.cursors import cursors
+from apis.analysis.dedupe import collapse
+from apis.analysis.registry import remove_emoji, score_many
+from apis.analysis.stream import stream_scores
 
-from keys import *
+SEARCH_URL = settings.TWITTER_BASE_URL + "/2/tweets/search/recent" # recent
 
-bearer_token = bearer_token()
+_bearer_token = None
+# shared by every search so concurrent requests stay inside the api quota together
+limiter = TokenBucket(settings.TWITTER_RATE, settings.TWITTER_BURST)
+# last tweets seen per search, served when we are rate limited before getting anything
+_fallback = OrderedDict()
+_fallback_lock = Lock()
+
+def get_bearer_token():
+    """
+    Reads the bearer token from the keys module the first time it is needed, so importing
+    this module does not require twitter keys to be set up
+    """
+    global _bearer_token
+    if _bearer_token is None:
+        from keys import bearer_token
+        _bearer_token = bearer_token()
+    return _bearer_token
+
+def auth_headers():
+    return {"Authorization": f"Bearer {get_bearer_token()}", "User-Agent": "v2RecentSearchPython"}
 
 def bearer_oauth(r):
     """
     Method required by bearer token authentication.
     """
-    r.headers["Authorization"] = f"Bearer {bearer_token}"
-    r.headers["User-Agent"] = "v2RecentSearchPython"
+    r.headers.update(auth_headers())
     return r
 
+def update_limiter(response):
+    """
+    Updates the shared limiter from a response's rate limit headers
+    """
+    limiter.update_from_headers(response.headers)
+    if response.status_code == 429 and response.headers.get("x-rate-limit-reset") is None:
+        # no reset time given, back off for a while
+        limiter.block_for(60)
+
 def connect_to_endpoint(url, params):
-    response = requests.get(url, auth=bearer_oauth, params=params)
-    print(response.status_code)
-    if response.status_code != 200:
-        raise Exception(response.status_code, response.text)
-    return response.json()
+    """
+    Makes one search request and updates the shared limiter from its rate limit headers
+    """
+    response = clients.get(url, upstream="twitter", auth=bearer_oauth, params=params)
+    update_limiter(response)
+    return response
 
-def remove_emoji(string):
-    emoji_pattern = re.compile("["
-    u"\U0001F600-\U0001F64F" u"\U0001F680-\U0001F6FF" u"\U0001F1E0-\U0001F1FF" u"\U00002500-\U00002BEF"  
-    u"\U00002702-\U000027B0"u"\U00002702-\U000027B0"u"\U000024C2-\U0001F251"u"\U0001f926-\U0001f937"
-    u"\U00010000-\U0010ffff"u"\u2640-\u2642"u"\u2600-\u2B55"u"\u200d"u"\u23cf"u"\u23e9"u"\u231a"
-    u"\ufe0f"u"\u3030""]+", flags=re.UNICODE)
-    return emoji_pattern.sub(r'', string)
+def remember_tweets(searchterm, tweets):
+    with _fallback_lock:
+        _fallback[searchterm] = tweets
+        _fallback.move_to_end(searchterm)
+        while len(_fallback) > settings.TWITTER_FALLBACK_SIZE:
+            _fallback.popitem(last=False)
+
+def remembered_tweets(searchterm):
+    with _fallback_lock:
+        return _fallback.get(searchterm)
 
 def filter_tweet(tweet):
     newline_remove = tweet.replace("\n", " ")
@@ -46,114 +84,226 @@ def filter_tweet(tweet):
     string_decode = " ".join(string_decode.split())
     return string_decode
 
-def twitter_search(searchterm):
-    sia = SIA()
-    json_out = {}
-    headlines = set()
-    results = []
+def new_budget():
+    return IngestBudget(settings.TWITTER_MAX_POSTS, settings.TWITTER_MAX_PAGES, settings.TWITTER_DEADLINE)
+
+def search_params(searchterm, since_id=None):
+    query_params = {'query': '%s lang:en' %searchterm,
+                #'tweet.fields': 'author_id',
+                'tweet.fields': 'id,text,author_id,in_reply_to_user_id,geo,conversation_id,created_at,lang,public_metrics,referenced_tweets,reply_settings,source',
+                'place.fields': 'full_name,id,country,country_code,geo,name,place_type',
+                'max_results': 100,
+                'expansions': 'author_id,in_reply_to_user_id,geo.place_id',
+                'user.fields': 'id,name,username,created_at,description,public_metrics,verified',
+                }
+    if since_id is not None:
+        query_params['since_id'] = since_id
+    return query_params
+
+def limiter_wait(budget):
+    """
+    Longest a page request may wait for the rate limiter
+    """
+    return min(settings.TWITTER_MAX_WAIT, max(0, budget.remaining_time()))
+
+def read_page(response, budget, query_params):
+    """
+    Handles one search response. Returns the page's tweets (None for a failed request) and
+    whether there is another page, whose next_token is set on query_params
+    """
+    if response.status_code == 429:
+        budget.stop("rate_limited")
+        return None, False
+    if response.status_code != 200:
+        if budget.pages <= 1:
+            raise Exception(response.status_code, response.text)
+        budget.stop("upstream_error")
+        return None, False
+    dict_response = response.json()
+    if budget.newest is None:
+        # results are newest first, so the first page has the newest id
+        budget.newest = dict_response.get('meta', {}).get('newest_id')
+    next_token = dict_response.get('meta', {}).get('next_token')
+    if next_token is not None:
+        query_params['next_token'] = next_token
+    return dict_response.get('data', []), next_token is not None
+
+def twitter_pages(searchterm, budget, since_id=None):
+    """
+    Yields the tweets of each result page, following next_token until the budget runs out.
+    Stops early, and marks the budget as truncated, if the rate limit would make us wait too long
+    or the api refuses a request after the first page. With since_id only newer tweets are fetched.
+    The newest tweet id is saved on the budget
+    """
+    query_params = search_params(searchterm, since_id)
+    while not budget.at_page_limit():
+        if not limiter.acquire(timeout=limiter_wait(budget)):
+            budget.stop("rate_limited")
+            return
+        if not budget.take_page():
+            return
+        tweets, more = read_page(connect_to_endpoint(SEARCH_URL, query_params), budget, query_params)
+        if tweets is not None:
+            yield tweets
+        if not more:
+            return
+
+async def twitter_pages_async(searchterm, budget, since_id=None):
+    """
+    twitter_pages() without blocking the event loop. Returns the list of pages, and stops once
+    there are enough tweets for the budget as they are only counted when cleaned
+    """
+    from apis import async_clients
+    query_params = search_params(searchterm, since_id)
+    pages = []
+    fetched = 0
+    while fetched < budget.item_limit() and not budget.at_page_limit():
+        if not await limiter.acquire_async(timeout=limiter_wait(budget)):
+            budget.stop("rate_limited")
+            break
+        if not budget.take_page():
+            break
+        response = await async_clients.get(SEARCH_URL, upstream="twitter", params=query_params, headers=auth_headers())
+        update_limiter(response)
+        tweets, more = read_page(response, budget, query_params)
+        if tweets is not None:
+            pages.append(tweets)
+            fetched += len(tweets)
+        if not more:
+            break
+    return pages
+
+def twitter_headlines(searchterm, budget=None, since_id=None, posts=None):
+    """
+    Yields each unique cleaned tweet for the search term, see clean_tweets()
+    """
+    if budget is None:
+        budget = new_budget()
+    return clean_tweets(searchterm, twitter_pages(searchterm, budget, since_id), budget, since_id, posts)
+
+def created_time(tweet):
+    """
+    Unix time of a tweet's created_at ("2022-03-01T12:00:00.000Z"), None if it has none
+    """
+    created_at = tweet.get("created_at")
+    if not created_at:
+        return None
     try:
-        query_params = {'query': '%s lang:en' %searchterm,
-                    #'tweet.fields': 'author_id',
-                    'tweet.fields': 'id,text,author_id,in_reply_to_user_id,geo,conversation_id,created_at,lang,public_metrics,referenced_tweets,reply_settings,source',
-                    'place.fields': 'full_name,id,country,country_code,geo,name,place_type',
-                    'max_results': 100,
-                    'expansions': 'author_id,in_reply_to_user_id,geo.place_id',
-                    'user.fields': 'id,name,username,created_at,description,public_metrics,verified',
-                    }
-        search_url = "https://api.twitter.com/2/tweets/search/recent" # recent
-        dict_response = connect_to_endpoint(search_url, query_params)
-        dict_response = dict(dict_response)
-
-        i = 0
-        while i < len(dict_response['data']):
-            tweet = dict_response['data'][i]["text"]
-            no_emoji = remove_emoji(tweet)
-            filtered_tweet = filter_tweet(no_emoji)
-            headlines.add(filtered_tweet)
-            i += 1
-
-        for line in headlines:
-            pol_score = sia.polarity_scores(line)
-            pol_score['headline'] = line
-            results.append(pol_score)
-
-        df = pd.DataFrame.from_records(results)
-        df['label']=0
-        df.loc[df['compound']> 0.2, 'label'] = 1 # positive
-        df.loc[df['compound']< -0.2, 'label'] = -1 # positive
-        df.head()
-        df2 = df[['headline', 'label']]
-        json_out.update({'Positive headlines': list(df[df['label'] == 1].headline)[:5]})
-        json_out.update({'Negative headlines': list(df[df['label'] == -1].headline)[:5]})
-        headline_count = df.label.value_counts()
-        json_out.update({'Headline count': headline_count.to_json()})
-        headline_count_per = df.label.value_counts(normalize=True)
-        json_out.update({'Headline count %': headline_count_per.to_json()})
-
-        tokenizer = RegexpTokenizer(r'\w+')
-        stop_words = stopwords.words('english')
-        # word distro
-        def process_text(headlines):
-            tokens = []
-            for line in headlines:
-                toks = tokenizer.tokenize(line)
-                toks = [t.lower() for t in toks if t.lower() not in stop_words]
-                tokens.extend(toks)
-            return tokens
-
-        pos_lines = list(df[df.label == 1].headline)
-        pos_tokens = process_text(pos_lines)
-        pos_freq = nltk.FreqDist(pos_tokens)
-        json_out.update({'Positive word distro': pos_freq.most_common(20)})
-
-        neg_lines = list(df2[df2.label == -1].headline)
-        neg_tokens = process_text(neg_lines)
-        neg_freq = nltk.FreqDist(neg_tokens)
-        json_out.update({'Negative word distro': neg_freq.most_common(20)})
-
-        dict_dump = json_out
-        new_json = {}
-        # Status code 
-        if len(dict_dump) > 2:
-            new_json.update({'status': "200"})
-
-            # Total reviews
-            count_str = dict_dump["Headline count"]
-            count = json.loads(count_str)
-            total_count = 0
-            for i, val in count.items():
-                total_count += val
-            new_json.update({'total_reviews': total_count})
-
-            # Rating
-            ratings_str = dict_dump["Headline count %"]
-            ratings = json.loads(ratings_str)
-            result_rating = 0
-            for i, val in ratings.items():
-                if i == "0" or i == "1":
-                    result_rating += val
-            result_rating = int(float(result_rating) * 100)
-            new_json.update({'rating': str(result_rating)})
-
-            # Comments and Word Bubble
-            if result_rating > 70:
-                comments = dict_dump["Positive headlines"]
-                new_json.update({'reviews': comments})
-                word_bubble = dict_dump["Positive word distro"]
-                new_json.update({'word_bubble': word_bubble})
-            else:
-                comments = dict_dump["Negative headlines"]
-                new_json.update({'reviews': comments})
-                word_bubble = dict_dump["Negative word distro"]
-                new_json.update({'word_bubble': word_bubble})
-        else:
-            new_json.update({'status': "503"})
-            new_json.update({"msg": "Entry unavailable"})
+        return datetime.fromisoformat(created_at.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+def clean_tweets(searchterm, pages, budget, since_id=None, posts=None):
+    """
+    Yields each unique cleaned tweet from pages of tweets. If we are rate limited before getting
+    any tweets, the tweets from the last successful search for the term are used instead, unless
+    this is an incremental search (since_id is set). If posts is given each cleaned tweet is
+    mapped in it to its tweet's (id, created time)
+    """
+    seen = set()
+    tweets = []
+    clean_seconds = 0.0
+    try:
+        for page in pages:
+            for tweet in page:
+                if not budget.take_item():
+                    break
+                start = time.perf_counter()
+                no_emoji = remove_emoji(tweet["text"])
+                filtered_tweet = filter_tweet(no_emoji)
+                clean_seconds += time.perf_counter() - start
+                if filtered_tweet not in seen:
+                    seen.add(filtered_tweet)
+                    tweets.append(filtered_tweet)
+                    if posts is not None:
+                        posts[filtered_tweet] = (tweet.get("id"), created_time(tweet))
+                    yield filtered_tweet
+            if budget.truncated:
+                break
+    finally:
+        tracing.record("clean", clean_seconds)
+    if tweets:
+        remember_tweets(searchterm, tweets)
+    elif budget.reason == "rate_limited" and since_id is None:
+        cached = remembered_tweets(searchterm)
+        if cached is None:
+            raise Exception(429, "Rate limited")
+        budget.reason = "rate_limited_cached"
+        for tweet in cached:
+            yield tweet
+
+def twitter_stream(searchterm):
+    """
+    Streaming version of twitter_search, see apis/analysis/stream.py
+    """
+    budget = new_budget()
+    return stream_scores(twitter_headlines(searchterm, budget), 70, budget=budget)
 
+def twitter_search(searchterm, category=None):
+    """
+    Scores the tweets for the search term. If the term was searched recently only tweets newer
+    than the last search are fetched and merged into its saved aggregate. The scored tweets are
+    saved under category for the trend endpoint
+    """
+    try:
+        state = cursors.get("twitter", searchterm, category)
+        since_id = state.cursor if state is not None else None
+        budget = new_budget()
+        posts = {}
+        with tracing.span("fetch"):
+            headlines = list(twitter_headlines(searchterm, budget, since_id, posts))
+        return score_tweets(searchterm, category, headlines, budget, state, posts)
+    except Exception as e:
+        return {'status': "503", "msg": "Entry unavailable"}
+
+async def twitter_search_async(searchterm, category=None, executor=None):
+    """
+    twitter_search() for the async server. Pages are fetched without blocking the event loop,
+    cleaning and scoring run on executor
+    """
+    try:
+        state = cursors.get("twitter", searchterm, category)
+        since_id = state.cursor if state is not None else None
+        budget = new_budget()
+        with tracing.span("fetch"):
+            pages = await twitter_pages_async(searchterm, budget, since_id)
+
+        def score():
+            posts = {}
+            headlines = list(clean_tweets(searchterm, pages, budget, since_id, posts))
+            return score_tweets(searchterm, category, headlines, budget, state, posts)
+
+        return await asyncio.get_running_loop().run_in_executor(executor, tracing.wrap(score))
     except Exception as e:
-        new_json.update({'status': "503"})
-        new_json.update({"msg": "Entry unavailable"})
+        return {'status': "503", "msg": "Entry unavailable"}
 
+def score_tweets(searchterm, category, headlines, budget, state, posts):
+    """
+    Scores cleaned tweets, merges them into the saved aggregate for the search (state) and saves
+    the new cursor. posts maps the tweets to their (id, created time) for the store. Returns the
+    result
+    """
+    aggregator = SentimentAggregator(70)
+    tracing.count_posts("twitter", len(headlines))
+    # near-duplicates are scored once and counted once per post
+    with tracing.span("dedupe"):
+        clusters = collapse(headlines)
+    with tracing.span("score"):
+        scored = score_many([text for text, size in clusters])
+    with tracing.span("aggregate"):
+        for pol_score, (text, size) in zip(scored, clusters):
+            pol_score['label'] = aggregator.add(pol_score, size)
+            pol_score['weight'] = size
+        if state is not None:
+            aggregator.merge(state.aggregator)
+    record_posts(searchterm, category, "twitter", scored, posts)
+    since_id = state.cursor if state is not None else None
+    if budget.newest is not None or state is not None:
+        cursors.save("twitter", searchterm, category, budget.newest or since_id, aggregator, state)
+    new_json = aggregator.result()
+    if new_json['status'] == "200":
+        new_json.update(budget.metadata())
+        new_json.update({'incremental': state is not None})
     return(new_json)
         
 if __name__ == "__main__":
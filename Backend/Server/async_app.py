@@ -0,0 +1,124 @@
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+import providers
+import settings
+import tracing
+from apis import async_clients, resilience
+from serving import is_ok, last_good, result_cache, snapshots
+from startup import report
+from store import record_result
+
+"""
+Async version of the results server for when upstreams are slow. Upstream calls don't block, so
+one process can have hundreds of searches in flight instead of one per worker thread. Scoring and
+the reddit provider (praw only has a blocking client) run on a thread pool. /pov/results returns
+the same json as flask_app.py; the other routes (aggregate, trend, streaming) are only on the
+WSGI server. Run from Backend/Server with
+
+    python async_app.py --port 5000
+    gunicorn async_app:app --worker-class aiohttp.GunicornWebWorker
+"""
+
+executor = ThreadPoolExecutor(max_workers=settings.ASYNC_EXECUTOR_WORKERS, thread_name_prefix="pov-async")
+
+def json_response(variables):
+    with tracing.span("serialize"):
+        body = json.dumps(variables)
+    return web.json_response(text=body)
+
+
+@web.middleware
+async def trace_requests(request, handler):
+    started = time.perf_counter()
+    trace = tracing.start_trace()
+    response = await handler(request)
+    if settings.SERVER_TIMING:
+        response.headers["Server-Timing"] = trace.server_timing()
+    route = request.match_info.route.name or "unknown"
+    tracing.observe_request(route, response.status, time.perf_counter() - started)
+    return response
+
+
+async def welcome(request):
+    homepage = """
+        <br>
+        <p>Welcome to POV's backend server. Use a correct endpoint to access our data.</p>
+        <br>
+        <p>List of API endpoints:</p>
+        <ul>
+            <li><a href="/pov/results/dune/movie">Movie Dune result</a></li>
+            <li><a href="/pov/results/playstation5/product">Product Playstation5 result</a></li>
+        </ul>
+    """
+    return web.Response(text=homepage, content_type="text/html")
+
+async def results(request):
+    term = request.match_info["term"].upper().strip()
+    term = term.replace(" ", "")
+    category = request.match_info["category"]
+    snapshot = snapshots.get(term, category)
+    if snapshot is not None:
+        variables = snapshot
+    elif providers.async_for_category(category) is not None:
+        variables = await result_cache.get_or_compute_async(term, category, lambda: search_term(term, category), should_cache=is_ok)
+        variables = last_good(term, category, variables)
+    else:
+        variables = {"status" : "503", "msg" : "Unavailable on all APIs"}
+    return json_response(variables)
+
+async def search_term(term, category):
+    """
+    Runs the async provider for the category. Only called on a cache miss or background refresh
+    """
+    search = providers.async_for_category(category)
+    try:
+        variables = await search(term, category, executor)
+    except Exception as e:
+        # e.g. the provider could not be imported because its api keys are missing
+        return {"status" : "503", "msg" : "Entry unavailable"}
+    record_result(term, category, variables)
+    return variables
+
+async def cache_stats(request):
+    return web.json_response(result_cache.stats())
+
+async def startup_report(request):
+    return web.json_response(report.as_dict())
+
+async def upstream_stats(request):
+    return web.json_response(resilience.stats())
+
+async def metrics(request):
+    return web.Response(text=tracing.metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+async def close_clients(app):
+    await async_clients.close()
+
+
+def create_app():
+    app = web.Application(middlewares=[trace_requests])
+    app.router.add_get("/", welcome, name="welcome")
+    app.router.add_get("/pov/results/{term}/{category}", results, name="results")
+    app.router.add_get("/pov/cache", cache_stats, name="cache_stats")
+    app.router.add_get("/pov/startup", startup_report, name="startup_report")
+    app.router.add_get("/pov/upstreams", upstream_stats, name="upstream_stats")
+    app.router.add_get("/metrics", metrics, name="metrics")
+    app.on_cleanup.append(close_clients)
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Async POV results server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    web.run_app(app, host=args.host, port=args.port)
@@ -0,0 +1,23 @@
+import glob
+import json
+import os
+
+"""
+Review texts from the bundled fixtures in Backend/Endpoints/json, shared by the benchmarks.
+"""
+
+FIXTURE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Endpoints", "json")
+
+
+def load_reviews(root=FIXTURE_ROOT):
+    """
+    IMDB reviewText bodies and amazon review bodies from the fixtures
+    """
+    reviews = []
+    for path in sorted(glob.glob(os.path.join(root, "**", "imdb_*_review.json"), recursive=True)):
+        with open(path) as json_file:
+            reviews.extend(review["reviewText"] for review in json.load(json_file)["reviews"])
+    for path in sorted(glob.glob(os.path.join(root, "**", "amazon_*_reviews.json"), recursive=True)):
+        with open(path) as json_file:
+            reviews.extend(review["review"] for review in json.load(json_file)["result"])
+    return reviews
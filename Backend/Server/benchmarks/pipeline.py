@@ -0,0 +1,331 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fixtures import FIXTURE_ROOT, load_reviews
+
+"""
+Times each stage of the analysis pipeline on its own: clean, dedupe, score, aggregate, word
+bubble, serialize, parsing of the amazon and imdb fixtures, and building an amazon result from
+pages of reviews (star histogram and text scoring). The inputs are the reviews in the
+bundled fixtures and synthetic corpora built from them. For every stage it reports throughput,
+per batch latency percentiles and peak memory (tracemalloc). Results are saved under
+benchmarks/results and compared against benchmarks/baseline.json. Run from Backend/Server:
+
+    python -m benchmarks.pipeline --corpus fixtures,1000,10000
+    python -m benchmarks.pipeline --save-baseline
+"""
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+STAGES = ["clean", "dedupe", "score", "aggregate", "wordbubble", "serialize", "parse", "reviews", "george"]
+DEFAULT_STAGES = ["clean", "dedupe", "score", "aggregate", "wordbubble", "serialize", "parse", "reviews"]
+
+# noise added to synthetic posts so the clean stage has work to do
+NOISE = ["RT @user123 ", "@someone ", "\n", "  ", "\U0001F600 ", "\U0001F44D ", "café "]
+
+
+def fixture_posts():
+    """
+    Every review in the fixtures split into sentences, roughly the length of a tweet or headline
+    """
+    posts = []
+    for review in load_reviews():
+        for sentence in review.replace("!", ".").replace("?", ".").split("."):
+            sentence = sentence.strip()
+            if len(sentence.split()) >= 3:
+                posts.append(sentence)
+    return posts
+
+
+def synthetic_posts(size, seed=0):
+    """
+    size posts made from fixture sentences with retweet, mention, emoji and whitespace noise.
+    About a fifth are near-duplicates of an earlier post, like a retweet chain
+    """
+    rand = random.Random(seed)
+    sentences = fixture_posts()
+    posts = []
+    for i in range(size):
+        if posts and rand.random() < 0.2:
+            post = rand.choice(posts) + " " + rand.choice(["wow", "so true", "agreed", ""])
+        else:
+            post = " ".join(rand.choice(sentences) for j in range(rand.randint(1, 2)))
+            if rand.random() < 0.5:
+                post = rand.choice(NOISE) + post
+        posts.append(post)
+    return posts
+
+
+def load_corpus(name):
+    if name == "fixtures":
+        return fixture_posts()
+    return synthetic_posts(int(name))
+
+
+def batches(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class Stages:
+    """
+    The pipeline stages over one corpus. Each stage function takes a batch of the previous
+    stage's output and returns its own output, so inputs are prepared outside the timings
+    """
+    def __init__(self, posts):
+        from apis.analysis.registry import registry
+        from apis.reddit_api import filter_post
+        self.registry = registry
+        self.filter_post = filter_post
+        self.posts = posts
+        self._outputs = {}
+
+    def clean(self, posts):
+        return [self.filter_post(self.registry.remove_emoji(post)) for post in posts]
+
+    def dedupe(self, lines):
+        from apis.analysis.dedupe import collapse
+        return collapse(lines)
+
+    def score(self, lines):
+        from apis.analysis.registry import score_many
+        return score_many(lines)
+
+    def aggregate(self, scored):
+        from apis.analysis.aggregator import SentimentAggregator
+        aggregator = SentimentAggregator(50)
+        for pol_score in scored:
+            aggregator.add(pol_score)
+        return aggregator
+
+    def wordbubble(self, lines):
+        from apis.analysis.wordbubble import WordBubble
+        bubble = WordBubble()
+        for line in lines:
+            bubble.add(line)
+        return bubble.top(20)
+
+    def serialize(self, results):
+        return [json.dumps(result) for result in results]
+
+    def parse(self, fixtures):
+        from apis.amazon_api import AmazonData
+        from apis.imdb_api import ImdbData
+        results = []
+        for kind, term, fetched in fixtures:
+            if kind == "amazon":
+                results.append(AmazonData(term, fetched=fetched).getResult())
+            else:
+                results.append(ImdbData(term, fetched=fetched).getResult())
+        return results
+
+    def reviews(self, reviews):
+        """
+        One amazon result from a batch of reviews, in pages of 10 like the reviews endpoint
+        """
+        from apis.amazon_api import AmazonData, PAGE_SIZE
+        stars_stat = {"1": "3%", "2": "2%", "3": "5%", "4": "15%", "5": "75%"}
+        pages = [{"total_reviews": len(reviews), "stars_stat": stars_stat, "result": page} for page in batches(reviews, PAGE_SIZE)]
+        return AmazonData("benchmark", fetched={"asin": "BENCHMARK", "pages": pages}).getResult()
+
+    def george(self, lines):
+        from apis.analysis.george import George
+        return George(lines).result
+
+    def input_for(self, stage):
+        """
+        The input a stage is benchmarked on, worked out (untimed) from the earlier stages
+        """
+        if stage in self._outputs:
+            return self._outputs[stage]
+        if stage == "clean":
+            value = self.posts
+        elif stage in ("dedupe", "score", "wordbubble", "george"):
+            value = self.clean(self.posts)
+        elif stage == "aggregate":
+            value = self.score(self.input_for("score"))
+        elif stage == "serialize":
+            scored = self.input_for("aggregate")
+            # one result per 100 posts, like a stream of provider responses
+            value = [self.aggregate(batch).result() for batch in batches(scored, 100)]
+        elif stage == "parse":
+            value = fixture_inputs()
+        elif stage == "reviews":
+            value = review_inputs(self.posts)
+        self._outputs[stage] = value
+        return value
+
+
+def fixture_inputs():
+    """
+    (provider, term, fetched) for every amazon product and imdb movie in the fixtures, in the
+    form the providers take pre-fetched data (see precompute.py)
+    """
+    from apis.imdb_api import review_titles
+
+    def load_json(path):
+        with open(path) as json_file:
+            return json.load(json_file)
+
+    inputs = []
+    for path in sorted(glob.glob(os.path.join(FIXTURE_ROOT, "**", "amazon_*_asin.json"), recursive=True)):
+        term = os.path.basename(path)[len("amazon_"):-len("_asin.json")]
+        reviews = path.replace("_asin.json", "_reviews.json")
+        if os.path.exists(reviews):
+            asin = load_json(path)["result"][0]["asin"]
+            inputs.append(("amazon", term, {"asin": asin, "pages": [load_json(reviews)]}))
+    for path in sorted(glob.glob(os.path.join(FIXTURE_ROOT, "**", "imdb_*_id.json"), recursive=True)):
+        term = os.path.basename(path)[len("imdb_"):-len("_id.json")]
+        ratings = path.replace("_id.json", "_movie_rating.json")
+        reviews = path.replace("_id.json", "_review.json")
+        if os.path.exists(ratings) and os.path.exists(reviews):
+            movie_id = load_json(path)["id"]
+            inputs.append(("imdb", term, {"id": movie_id[7:-1], "ratings": load_json(ratings),
+                                          "reviews": review_titles(load_json(reviews))}))
+    return inputs
+
+
+def review_inputs(posts, seed=0):
+    """
+    An amazon review for each post, with a star rating and verified purchase flag
+    """
+    rand = random.Random(seed)
+    return [{"id": "R{}".format(i), "rating": rand.choices([1, 2, 3, 4, 5], [3, 2, 5, 15, 75])[0], "review": post,
+             "verified_purchase": rand.random() < 0.85} for i, post in enumerate(posts)]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def bench_stage(func, items, batch_size, repeat):
+    """
+    Runs func over items in batches, repeat times. Returns throughput (items per second of the
+    median run), batch latency percentiles in ms and peak traced memory of one more run in MiB
+    """
+    runs = []
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for batch in batches(items, batch_size):
+            batch_start = time.perf_counter()
+            func(batch)
+            latencies.append((time.perf_counter() - batch_start) * 1000)
+        runs.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    for batch in batches(items, batch_size):
+        func(batch)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    median = statistics.median(runs)
+    return {
+        "items": len(items),
+        "seconds": round(median, 6),
+        "items_per_second": round(len(items) / median, 1) if median else 0.0,
+        "batch_size": batch_size,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "peak_mib": round(peak / (1 << 20), 3),
+    }
+
+
+def run(corpora, stages, batch_size, repeat):
+    results = {}
+    for corpus in corpora:
+        pipeline = Stages(load_corpus(corpus))
+        for stage in stages:
+            if stage == "parse" and corpus != "fixtures":
+                continue
+            items = pipeline.input_for(stage)
+            result = bench_stage(getattr(pipeline, stage), items, batch_size, repeat)
+            results["{}/{}".format(corpus, stage)] = result
+            print("{:<22} {:>8} items {:>12.1f} items/s  p50 {:>9.3f}ms  p95 {:>9.3f}ms  p99 {:>9.3f}ms  peak {:>8.3f}MiB".format(
+                "{}/{}".format(corpus, stage), result["items"], result["items_per_second"], result["p50_ms"],
+                result["p95_ms"], result["p99_ms"], result["peak_mib"]), flush=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change in throughput against the baseline and returns the benchmarks that got
+    slower by more than tolerance (a fraction)
+    """
+    regressions = []
+    print("\n{:<22} {:>14} {:>14} {:>9}".format("benchmark", "baseline/s", "now/s", "change"))
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None or not before["items_per_second"]:
+            continue
+        change = result["items_per_second"] / before["items_per_second"] - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("{:<22} {:>14.1f} {:>14.1f} {:>+8.1%}{}".format(name, before["items_per_second"], result["items_per_second"],
+                                                         change, flag))
+    return regressions
+
+
+def save(path, results):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as out:
+        json.dump({
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }, out, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analysis pipeline benchmarks")
+    parser.add_argument("--corpus", default="fixtures,1000,10000",
+                        help="comma separated corpora: fixtures and/or synthetic post counts e.g. 100000")
+    parser.add_argument("--stages", default=",".join(DEFAULT_STAGES), help="comma separated, from " + ",".join(STAGES))
+    parser.add_argument("--batch", type=int, default=100, help="posts per timed batch")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE, help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown before a stage counts as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="save these results as the new baseline")
+    args = parser.parse_args()
+
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error("unknown stages: " + ",".join(unknown))
+    results = run([corpus for corpus in args.corpus.split(",") if corpus], stages, args.batch, args.repeat)
+
+    path = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    save(path, results)
+    print("\nsaved {}".format(path))
+    if args.save_baseline:
+        save(args.baseline, results)
+        print("saved baseline {}".format(args.baseline))
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file)["results"], args.tolerance)
+        if regressions:
+            print("\n{} regression(s): {}".format(len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
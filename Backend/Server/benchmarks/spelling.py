@@ -0,0 +1,74 @@
+import argparse
+import difflib
+import time
+
+from textblob import TextBlob
+
+from apis.analysis.spelling import SymSpellCorrector, WORD_PATTERN
+from benchmarks.fixtures import load_reviews
+
+"""
+Compares the SymSpell corrector against the original str(TextBlob(text).correct()) call on the
+bundled review fixtures. TextBlob's output is used as the reference, so accuracy is the share of
+words SymSpell corrects the same way. Run from Backend/Server:
+
+    python -m benchmarks.spelling --reviews 5
+"""
+
+class TextBlobBaseline:
+    """
+    The spelling correction the analysers did before SymSpell, without any memoization
+    """
+    def correct(self, text):
+        return str(TextBlob(text).correct())
+
+
+def run(corrector, texts):
+    start = time.perf_counter()
+    corrected = [corrector.correct(text) for text in texts]
+    return corrected, time.perf_counter() - start
+
+
+def word_agreement(reference, other):
+    """
+    Share of the reference's words the other output has in the same place. The two word lists
+    are aligned first, so a word one corrector splits or drops doesn't shift every word after it
+    """
+    same = 0
+    total = 0
+    for a, b in zip(reference, other):
+        a_words = WORD_PATTERN.findall(a)
+        b_words = WORD_PATTERN.findall(b)
+        total += len(a_words)
+        matcher = difflib.SequenceMatcher(None, a_words, b_words, autojunk=False)
+        same += sum(block.size for block in matcher.get_matching_blocks())
+    return same / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spelling corrector benchmark")
+    parser.add_argument("--reviews", type=int, default=5, help="reviews to correct, TextBlob is slow so keep this small")
+    args = parser.parse_args()
+
+    texts = load_reviews()[:args.reviews]
+    words = sum(len(WORD_PATTERN.findall(text)) for text in texts)
+    print("{} reviews, {} words".format(len(texts), words))
+
+    start = time.perf_counter()
+    symspell = SymSpellCorrector()
+    print("symspell index built in {:.2f}s ({} deletes)".format(time.perf_counter() - start, len(symspell.index)))
+
+    reference, textblob_seconds = run(TextBlobBaseline(), texts)
+    cold, cold_seconds = run(symspell, texts)
+    warm, warm_seconds = run(symspell, texts)
+
+    print("{:<20} {:>10} {:>14} {:>10}".format("corrector", "seconds", "words/s", "accuracy"))
+    for name, output, seconds in [("textblob", reference, textblob_seconds),
+                                  ("symspell (cold)", cold, cold_seconds),
+                                  ("symspell (memoized)", warm, warm_seconds)]:
+        print("{:<20} {:>10.3f} {:>14.0f} {:>10.3f}".format(name, seconds, words / seconds if seconds else 0,
+                                                            word_agreement(reference, output)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from singleflight import SingleFlight
+
+"""
+In-memory cache for /pov/results. Entries are keyed on the normalized search term and category,
+expire after a per-category TTL and are evicted least recently used first once the cache is full.
+An expired entry is still served for a while after its TTL (stale-while-revalidate) while a
+background thread recomputes it. Concurrent misses for the same entry share one computation,
+see singleflight.py.
+"""
+
+def normalize(term, category):
+    return (term.upper().strip().replace(" ", ""), category.lower().strip())
+
+
+class ResultCache:
+    """
+    Size bounded TTL + LRU cache with stale-while-revalidate, coalesced misses and hit/miss counters
+    """
+    def __init__(self, max_size, ttls, default_ttl, stale_ttl, refresh_workers=2, coalesce=True):
+        self.max_size = max_size
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._tasks = set()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="pov-cache-refresh")
+        self.flights = SingleFlight("results", enabled=coalesce)
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def ttl_for(self, category):
+        return self.ttls.get(category, self.default_ttl)
+
+    def get_or_compute(self, term, category, compute, should_cache=None):
+        """
+        Returns the cached value for term/category. A fresh entry is returned as is, a stale one
+        is returned and refreshed in the background, and a missing or expired one is computed now.
+        should_cache decides whether a computed value is stored, e.g. to skip error responses.
+        Calls missing the same entry at the same time wait for one compute() and share its value
+        """
+        key = normalize(term, category)
+        state, value = self._lookup(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            self._refresh(key, compute, should_cache)
+            return value
+        return self.flights.do(key, lambda: self._compute(key, compute, should_cache))
+
+    async def get_or_compute_async(self, term, category, compute, should_cache=None):
+        """
+        get_or_compute() for the async server, compute is a coroutine function. Stale entries
+        are refreshed in a task on the running event loop
+        """
+        key = normalize(term, category)
+        state, value = self._lookup(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            self._refresh_async(key, compute, should_cache)
+            return value
+        return await self.flights.do_async(key, lambda: self._compute_async(key, compute, should_cache))
+
+    def get(self, term, category):
+        """
+        Returns the stored value for term/category regardless of its age, or None
+        """
+        entry = self._get_entry(normalize(term, category))
+        if entry is None:
+            return None
+        return entry[0]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "coalescing": self.flights.stats(),
+            }
+
+    def _compute(self, key, compute, should_cache):
+        value = compute()
+        if should_cache is None or should_cache(value):
+            self.put(key, value)
+        return value
+
+    async def _compute_async(self, key, compute, should_cache):
+        value = await compute()
+        if should_cache is None or should_cache(value):
+            self.put(key, value)
+        return value
+
+    def _lookup(self, key):
+        """
+        Returns ("fresh", value), ("stale", value) or (None, None) and counts the lookup
+        """
+        entry = self._get_entry(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.monotonic() - stored_at
+            ttl = self.ttl_for(key[1])
+            if age < ttl:
+                self._count("hits")
+                return "fresh", value
+            if age < ttl + self.stale_ttl:
+                self._count("stale_hits")
+                return "stale", value
+        self._count("misses")
+        return None, None
+
+    def _get_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _refresh(self, key, compute, should_cache):
+        """
+        Recomputes key in the background unless a refresh for it is already running
+        """
+        if not self._start_refresh(key):
+            return
+
+        def run():
+            try:
+                # a miss for key while this runs (the entry went past its stale ttl) waits for it
+                self.flights.do(key, lambda: self._compute(key, compute, should_cache))
+                self._count("refreshes")
+            except Exception:
+                self._count("refresh_errors")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(run)
+
+    def _refresh_async(self, key, compute, should_cache):
+        """
+        _refresh() as a task on the running event loop
+        """
+        if not self._start_refresh(key):
+            return
+
+        async def run():
+            try:
+                await self.flights.do_async(key, lambda: self._compute_async(key, compute, should_cache))
+                self._count("refreshes")
+            except Exception:
+                self._count("refresh_errors")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+                self._tasks.discard(task)
+
+        task = asyncio.get_running_loop().create_task(run())
+        # the loop only keeps weak references to tasks
+        self._tasks.add(task)
+
+    def _start_refresh(self, key):
+        """
+        Marks key as being refreshed. Returns False if a refresh for it is already running
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
@@ -1,14 +1,32 @@
-from flask import Flask
+from flask import Flask, Response, g, request, stream_with_context
 import json
+import time
 
-from apis.amazon_api import AmazonData
-from apis.imdb_api import ImdbData
-from apis.reddit_api import reddit_search
-from apis.twitter_api import twitter_search
-
-from keys import *
+import providers
+import settings
+import tracing
+from aggregate import aggregate_search
+from apis import resilience
+from serving import is_ok, last_good, result_cache, snapshots
+from store import get_store, record_result
+from startup import report
 
 app = Flask(__name__)
+
+@app.before_request
+def start_trace():
+    g.started = time.perf_counter()
+    tracing.start_trace()
+
+@app.after_request
+def end_trace(response):
+    trace = tracing.current_trace()
+    if trace is not None and settings.SERVER_TIMING:
+        response.headers["Server-Timing"] = trace.server_timing()
+    tracing.observe_request(request.endpoint or "unknown", response.status_code, time.perf_counter() - g.started)
+    tracing.end_trace()
+    return response
+
 @app.route('/')
 def welcome():
     homepage = """
@@ -19,6 +37,8 @@ def welcome():
         <ul>
             <li><a href="/pov/results/dune/movie">Movie Dune result</a></li>
             <li><a href="/pov/results/playstation5/product">Product Playstation5 result</a></li>
+            <li><a href="/pov/aggregate/dune/movie">Movie Dune result from all sources</a></li>
+            <li><a href="/pov/trend/dune/movie">Movie Dune rating over time</a></li>
         </ul>
     """
     return homepage
@@ -27,21 +47,113 @@ def welcome():
 def results(term: str, category: str):
     term = term.upper().strip()
     term = term.replace(" ", "")
-    reddit_list = ['game', 'music', 'sport', 'travel']
-    twitter_list = ['celebrity', 'politics']
-    if category == "product":
-        variables = AmazonData(term).getResult()
-    elif category == "movie":
-        variables = ImdbData(term).getResult()
-    elif category in reddit_list:
-        variables = reddit_search(term, category, client_id(), client_secret(), user_agent())
-    elif category in twitter_list:
-        variables = twitter_search(term)
+    if request.args.get("stream") in ("1", "true", "ndjson"):
+        return stream_results(term, category)
+    snapshot = snapshots.get(term, category)
+    if snapshot is not None:
+        variables = snapshot
+    elif providers.for_category(category) is not None:
+        variables = result_cache.get_or_compute(term, category, lambda: search_term(term, category), should_cache=is_ok)
+        variables = last_good(term, category, variables)
     else:
         variables = {"status" : "503", "msg" : "Unavailable on all APIs"}
-    app_json = json.dumps(variables)
+    with tracing.span("serialize"):
+        app_json = json.dumps(variables)
     return app_json
 
+@app.route('/pov/aggregate/<string:term>/<string:category>')
+def aggregate(term: str, category: str):
+    """
+    Combined result from every provider that covers the category, see aggregate.py
+    """
+    term = term.upper().strip()
+    term = term.replace(" ", "")
+    variables = result_cache.get_or_compute(term, "all/" + category, lambda: aggregate_search(term, category), should_cache=is_ok)
+    with tracing.span("serialize"):
+        app_json = json.dumps(variables)
+    return app_json
+
+def stream_results(term, category):
+    """
+    Streams newline delimited json records (see apis/analysis/stream.py). Categories without a
+    streaming provider get their normal result as a single summary record
+    """
+    search = providers.stream_for(category)
+
+    def records():
+        if search is None:
+            if providers.for_category(category) is None:
+                variables = {"status" : "503", "msg" : "Unavailable on all APIs"}
+            else:
+                variables = search_term(term, category)
+            variables = dict(variables, type="summary")
+            yield json.dumps(variables) + "\n"
+            return
+        try:
+            for record in search(term, category):
+                yield json.dumps(record) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "status": "503", "msg": "Entry unavailable"}) + "\n"
+
+    return Response(stream_with_context(records()), mimetype="application/x-ndjson")
+
+def search_term(term, category):
+    """
+    Runs the provider for the category. Only called on a cache miss or background refresh
+    """
+    search = providers.for_category(category)
+    try:
+        variables = search(term, category)
+    except Exception as e:
+        # e.g. the provider could not be imported because its api keys are missing
+        return {"status" : "503", "msg" : "Entry unavailable"}
+    record_result(term, category, variables)
+    return variables
+
+@app.route('/pov/trend/<string:term>/<string:category>')
+def trend(term: str, category: str):
+    """
+    Rating over time from the local store, bucketed by SQL. Query params: bucket (seconds),
+    since and until (unix times) and source (reddit or twitter). Without a source social
+    categories use their own source's posts and the others their results history
+    """
+    store = get_store()
+    if store is None:
+        return json.dumps({"status" : "503", "msg" : "Trend store disabled"})
+    try:
+        bucket = max(1, int(request.args.get("bucket", settings.TREND_BUCKET)))
+        since = request.args.get("since", type=float)
+        until = request.args.get("until", type=float)
+    except ValueError:
+        return json.dumps({"status" : "400", "msg" : "bucket must be a number of seconds"})
+    source = request.args.get("source") or providers.post_source(category)
+    based_on, points = store.trend(term, category, bucket, since, until, source)
+    if not points:
+        return json.dumps({"status" : "503", "msg" : "Entry unavailable"})
+    return json.dumps({"status" : "200", "bucket" : bucket, "based_on" : based_on, "points" : points})
+
+@app.route('/pov/cache')
+def cache_stats():
+    return json.dumps(result_cache.stats())
+
+@app.route('/pov/upstreams')
+def upstream_stats():
+    """
+    Circuit breaker state and hedge delay of each upstream called so far
+    """
+    return json.dumps(resilience.stats())
+
+@app.route('/metrics')
+def metrics():
+    """
+    Stage, upstream and request timings and post counts in the Prometheus text format
+    """
+    return Response(tracing.metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/pov/startup')
+def startup_report():
+    return json.dumps(report.as_dict())
+
 
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
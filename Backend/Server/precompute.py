@@ -0,0 +1,163 @@
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import settings
+from providers import TWITTER_CATEGORIES
+from snapshots import SCHEMA, snapshot_key, snapshot_path
+
+"""
+Offline batch job that runs the analysis pipeline over a corpus and writes a new snapshot version
+for the server to serve (see snapshots.py). Run from Backend/Server:
+
+    python precompute.py --corpus ../Endpoints/json --jsonl dumps/*.jsonl
+
+The corpus directory is scanned for amazon and imdb fixtures named like the ones in
+Backend/Endpoints/json. JSONL dumps hold social posts, one {"term", "category", "text"} per line.
+"""
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Endpoints", "json")
+
+
+def load_json(path):
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def find_fixture_jobs(corpus):
+    """
+    One job per amazon product or imdb movie that has all of its fixture files
+    """
+    files = {}
+    for path in glob.glob(os.path.join(corpus, "**", "*.json"), recursive=True):
+        files[os.path.basename(path)] = path
+    jobs = []
+    for filename, path in sorted(files.items()):
+        match = re.match(r"^amazon_(.+)_asin\.json$", filename)
+        if match and "amazon_{}_reviews.json".format(match.group(1)) in files:
+            term = match.group(1)
+            jobs.append(("product", term, {"asin": path, "pages": review_pages(files, term)}))
+        match = re.match(r"^imdb_(.+)_id\.json$", filename)
+        if match:
+            term = match.group(1)
+            rating = files.get("imdb_{}_movie_rating.json".format(term))
+            review = files.get("imdb_{}_review.json".format(term))
+            if rating and review:
+                jobs.append(("movie", term, {"id": path, "ratings": rating, "reviews": review}))
+    return jobs
+
+
+def review_pages(files, term):
+    """
+    Paths of a product's review pages in order, amazon_<term>_reviews.json then any
+    amazon_<term>_reviews_<n>.json
+    """
+    pages = {1: files["amazon_{}_reviews.json".format(term)]}
+    for filename, path in files.items():
+        match = re.match(r"^amazon_{}_reviews_(\d+)\.json$".format(re.escape(term)), filename)
+        if match:
+            pages[int(match.group(1))] = path
+    return [pages[page] for page in sorted(pages)]
+
+
+def find_post_jobs(jsonl_paths):
+    """
+    One job per term and category in the JSONL dumps
+    """
+    posts = defaultdict(list)
+    for path in jsonl_paths:
+        with open(path) as jsonl_file:
+            for line in jsonl_file:
+                if not line.strip():
+                    continue
+                post = json.loads(line)
+                posts[(post["category"], post["term"])].append(post["text"])
+    return [("posts", key, texts) for key, texts in sorted(posts.items())]
+
+
+def run_job(job):
+    """
+    Runs the analysis for one job and returns (category, term, result)
+    """
+    kind, term, inputs = job
+    if kind == "product":
+        from apis.amazon_api import AmazonData
+        asin = load_json(inputs["asin"])["result"][0]["asin"]
+        fetched = {"asin": asin, "pages": [load_json(path) for path in inputs["pages"]]}
+        return "product", term, AmazonData(term, fetched=fetched).getResult()
+    elif kind == "movie":
+        from apis.imdb_api import ImdbData, movie_id, review_titles
+        fetched = {"id": movie_id(load_json(inputs["id"])), "ratings": load_json(inputs["ratings"]),
+                   "reviews": review_titles(load_json(inputs["reviews"]))}
+        return "movie", term, ImdbData(term, fetched=fetched).getResult()
+    else:
+        from apis.analysis.aggregator import SentimentAggregator
+        from apis.analysis.dedupe import collapse
+        from apis.analysis.registry import registry
+        from apis.reddit_api import filter_post
+        category, term = term
+        aggregator = SentimentAggregator(70 if category in TWITTER_CATEGORIES else 50)
+        seen = set()
+        lines = []
+        for text in inputs:
+            line = filter_post(registry.remove_emoji(text))
+            if line not in seen:
+                seen.add(line)
+                lines.append(line)
+        for line, size in collapse(lines):
+            aggregator.add(registry.score(line), size)
+        return category, term, aggregator.result()
+
+
+def write_snapshots(out_dir, results):
+    """
+    Writes results as a new version and points LATEST at it. Returns the version
+    """
+    version = time.strftime("%Y%m%dT%H%M%S")
+    generated_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    written = 0
+    for category, term, result in results:
+        if result.get("status") != "200":
+            continue
+        term, category = snapshot_key(term, category)
+        path = snapshot_path(out_dir, version, category, term)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as json_file:
+            json.dump({"schema": SCHEMA, "version": version, "generated_at": generated_at,
+                       "term": term, "category": category, "result": result}, json_file)
+        written += 1
+    os.makedirs(os.path.join(out_dir, version), exist_ok=True)
+    with open(os.path.join(out_dir, version, "manifest.json"), "w") as json_file:
+        json.dump({"schema": SCHEMA, "version": version, "generated_at": generated_at, "results": written}, json_file)
+    # swap LATEST in one step so the server never reads a partial version
+    latest_tmp = os.path.join(out_dir, "LATEST.tmp")
+    with open(latest_tmp, "w") as latest_file:
+        latest_file.write(version)
+    os.replace(latest_tmp, os.path.join(out_dir, "LATEST"))
+    return version, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute POV result snapshots")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="directory of amazon/imdb json fixtures")
+    parser.add_argument("--jsonl", nargs="*", default=[], help="JSONL dumps of social posts")
+    parser.add_argument("--out", default=settings.SNAPSHOT_DIR, help="snapshot directory")
+    parser.add_argument("--workers", type=int, default=settings.SCORING_PROCESSES, help="worker processes")
+    args = parser.parse_args()
+
+    jobs = find_fixture_jobs(args.corpus) + find_post_jobs(args.jsonl)
+    print("{} jobs".format(len(jobs)))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(run_job, jobs))
+    version, written = write_snapshots(args.out, results)
+    print("wrote {} results as version {} in {:.2f}s".format(written, version, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import asyncio
+import functools
+import importlib
+import threading
+
+from startup import report, timed
+from tracing import traced, wrap
+
+"""
+Maps a search category to the provider that handles it. Provider modules are imported the
+first time their category is requested, so a worker only pays for pandas, nltk, praw and the
+api keys when it actually needs them, and a broken provider can't stop the others from loading.
+"""
+
+REDDIT_CATEGORIES = ['game', 'music', 'sport', 'travel']
+TWITTER_CATEGORIES = ['celebrity', 'politics']
+
+_modules = {}
+_lock = threading.Lock()
+
+
+def load(module_name):
+    """
+    Imports a module once and records how long it took in the startup report
+    """
+    module = _modules.get(module_name)
+    if module is None:
+        with _lock:
+            module = _modules.get(module_name)
+            if module is None:
+                with timed("import {}".format(module_name)):
+                    module = importlib.import_module(module_name)
+                _modules[module_name] = module
+    return module
+
+
+@traced("provider-amazon")
+def amazon(term, category):
+    return load("apis.amazon_api").AmazonData(term).getResult()
+
+@traced("provider-imdb")
+def imdb(term, category):
+    return load("apis.imdb_api").ImdbData(term).getResult()
+
+@traced("provider-reddit")
+def reddit(term, category):
+    keys = load("keys")
+    return load("apis.reddit_api").reddit_search(term, category, keys.client_id(), keys.client_secret(), keys.user_agent())
+
+@traced("provider-twitter")
+def twitter(term, category):
+    return load("apis.twitter_api").twitter_search(term, category)
+
+
+def reddit_stream(term, category):
+    keys = load("keys")
+    return load("apis.reddit_api").reddit_stream(term, category, keys.client_id(), keys.client_secret(), keys.user_agent())
+
+def twitter_stream(term, category):
+    return load("apis.twitter_api").twitter_stream(term)
+
+
+# async versions for async_app.py. executor runs the blocking and CPU bound parts
+@traced("provider-amazon")
+async def amazon_async(term, category, executor=None):
+    return (await load("apis.amazon_api").AmazonData.create_async(term, executor)).getResult()
+
+@traced("provider-imdb")
+async def imdb_async(term, category, executor=None):
+    return (await load("apis.imdb_api").ImdbData.create_async(term)).getResult()
+
+async def reddit_async(term, category, executor=None):
+    # praw only has a blocking client, so the whole (traced) search runs on the executor
+    return await asyncio.get_running_loop().run_in_executor(executor, wrap(functools.partial(reddit, term, category)))
+
+@traced("provider-twitter")
+async def twitter_async(term, category, executor=None):
+    return await load("apis.twitter_api").twitter_search_async(term, category, executor)
+
+
+def for_category(category):
+    """
+    Returns the search function for a category or None if no provider handles it
+    """
+    if category == "product":
+        return amazon
+    elif category == "movie":
+        return imdb
+    elif category in REDDIT_CATEGORIES:
+        return reddit
+    elif category in TWITTER_CATEGORIES:
+        return twitter
+    return None
+
+
+def async_for_category(category):
+    """
+    Returns the async search function for a category or None if no provider handles it
+    """
+    if category == "product":
+        return amazon_async
+    elif category == "movie":
+        return imdb_async
+    elif category in REDDIT_CATEGORIES:
+        return reddit_async
+    elif category in TWITTER_CATEGORIES:
+        return twitter_async
+    return None
+
+
+def stream_for(category):
+    """
+    Returns the streaming search function for a category, only the social providers stream
+    """
+    if category in REDDIT_CATEGORIES:
+        return reddit_stream
+    elif category in TWITTER_CATEGORIES:
+        return twitter_stream
+    return None
+
+
+def upstreams_for(category):
+    """
+    The upstreams (see apis/resilience.py) the category's provider calls
+    """
+    if category == "product":
+        return ["amazon"]
+    elif category == "movie":
+        return ["imdb"]
+    elif category in REDDIT_CATEGORIES:
+        return ["reddit"]
+    elif category in TWITTER_CATEGORIES:
+        return ["twitter"]
+    return []
+
+
+def post_source(category):
+    """
+    The social source whose scored posts make up the category's trend, None for categories whose
+    trend comes from their results (product and movie)
+    """
+    if category in REDDIT_CATEGORIES:
+        return "reddit"
+    elif category in TWITTER_CATEGORIES:
+        return "twitter"
+    return None
+
+
+def sources_for(category):
+    """
+    Returns the (name, search function) pairs the aggregate endpoint queries for a category.
+    The category's own provider comes first
+    """
+    if category == "product":
+        return [("amazon", amazon), ("twitter", twitter)]
+    elif category == "movie":
+        return [("imdb", imdb), ("reddit", reddit), ("twitter", twitter)]
+    elif category in REDDIT_CATEGORIES:
+        return [("reddit", reddit), ("twitter", twitter)]
+    elif category in TWITTER_CATEGORIES:
+        return [("twitter", twitter), ("reddit", reddit)]
+    return []
+
+
+def warmup():
+    """
+    Imports every provider and loads the sentiment models. A provider that fails to import
+    (e.g. missing keys) is reported and skipped
+    """
+    for module_name in ["apis.amazon_api", "apis.imdb_api", "apis.analysis.registry", "apis.reddit_api", "apis.twitter_api"]:
+        try:
+            load(module_name)
+        except Exception as e:
+            print("[startup] could not import {}: {}".format(module_name, e), flush=True)
+    with timed("load sentiment models"):
+        load("apis.analysis.registry").preload()
+    print(report, flush=True)
+
+
+def start_warmup():
+    """
+    Runs warmup() in a daemon thread so the server can accept requests straight away
+    """
+    thread = threading.Thread(target=warmup, name="pov-warmup", daemon=True)
+    thread.start()
+    return thread
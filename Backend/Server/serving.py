@@ -0,0 +1,43 @@
+import providers
+import settings
+import tracing
+from apis import resilience
+from cache import ResultCache
+from snapshots import SnapshotStore
+
+"""
+State and helpers shared by the WSGI server (flask_app.py) and the async server (async_app.py):
+the result cache, the precomputed snapshots and the fallback to the last good result, so both
+servers answer a search the same way.
+"""
+
+# providers are imported lazily on their first request, see providers.py
+if settings.PRELOAD:
+    providers.warmup()
+elif settings.WARMUP:
+    providers.start_warmup()
+
+result_cache = ResultCache(settings.RESULT_CACHE_SIZE, settings.RESULT_CACHE_TTLS, settings.RESULT_CACHE_DEFAULT_TTL,
+                           settings.RESULT_CACHE_STALE_TTL, settings.RESULT_CACHE_REFRESH_WORKERS,
+                           settings.RESULT_COALESCING)
+
+snapshots = SnapshotStore(settings.SNAPSHOT_DIR, settings.SNAPSHOT_RELOAD_INTERVAL, settings.SNAPSHOT_MAX_AGES,
+                          settings.SNAPSHOT_DEFAULT_MAX_AGE)
+
+
+def is_ok(variables):
+    return variables.get("status") == "200"
+
+
+def last_good(term, category, variables):
+    """
+    The search's last good result from the cache, regardless of age, if it failed because its
+    upstream's circuit is open. Otherwise variables
+    """
+    if is_ok(variables) or not settings.SERVE_LAST_GOOD or resilience.healthy(providers.upstreams_for(category)):
+        return variables
+    last = result_cache.get(term, category)
+    if last is None or not is_ok(last):
+        return variables
+    tracing.count_last_good(category)
+    return last
@@ -0,0 +1,205 @@
+import os
+
+"""
+Server settings. Every value can be overridden with an environment variable of the same name
+prefixed with POV_, e.g. POV_WARMUP=1
+"""
+
+def env_flag(name, default=False):
+    val = os.environ.get("POV_" + name)
+    if val is None:
+        return default
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
+def env_int(name, default):
+    return int(os.environ.get("POV_" + name, default))
+
+def env_float(name, default):
+    return float(os.environ.get("POV_" + name, default))
+
+def env_str(name, default):
+    return os.environ.get("POV_" + name, default)
+
+
+# Startup
+# import every provider and load the sentiment models before serving (use with gunicorn --preload)
+PRELOAD = env_flag("PRELOAD")
+# import providers and load models in a background thread after startup
+WARMUP = env_flag("WARMUP")
+
+# Result cache
+RESULT_CACHE_SIZE = env_int("RESULT_CACHE_SIZE", 512)
+# seconds a result is fresh for, per category
+RESULT_CACHE_TTLS = {
+    "product": env_int("CACHE_TTL_PRODUCT", 3600),
+    "movie": env_int("CACHE_TTL_MOVIE", 3600),
+    "game": env_int("CACHE_TTL_GAME", 600),
+    "music": env_int("CACHE_TTL_MUSIC", 600),
+    "sport": env_int("CACHE_TTL_SPORT", 300),
+    "travel": env_int("CACHE_TTL_TRAVEL", 600),
+    "celebrity": env_int("CACHE_TTL_CELEBRITY", 300),
+    "politics": env_int("CACHE_TTL_POLITICS", 300),
+}
+RESULT_CACHE_DEFAULT_TTL = env_int("CACHE_TTL_DEFAULT", 300)
+# seconds after expiry a result may still be served while it is refreshed in the background
+RESULT_CACHE_STALE_TTL = env_int("RESULT_CACHE_STALE_TTL", 1800)
+RESULT_CACHE_REFRESH_WORKERS = env_int("RESULT_CACHE_REFRESH_WORKERS", 2)
+# identical searches arriving while one is being computed wait for it instead of running their own
+RESULT_COALESCING = env_flag("RESULT_COALESCING", True)
+
+# Upstream HTTP clients
+# number of hosts to keep a connection pool for, and connections kept alive per host
+HTTP_POOL_CONNECTIONS = env_int("HTTP_POOL_CONNECTIONS", 10)
+HTTP_POOL_MAXSIZE = env_int("HTTP_POOL_MAXSIZE", 20)
+HTTP_CONNECT_TIMEOUT = env_float("HTTP_CONNECT_TIMEOUT", 3.05)
+HTTP_READ_TIMEOUT = env_float("HTTP_READ_TIMEOUT", 10)
+HTTP_RETRIES = env_int("HTTP_RETRIES", 0)
+
+# Fetch pipeline
+# threads shared by all providers for running independent upstream calls at the same time
+FETCH_WORKERS = env_int("FETCH_WORKERS", 16)
+
+# Amazon reviews, pages of 10 are fetched until whichever of these is hit first
+AMAZON_MAX_REVIEWS = env_int("AMAZON_MAX_REVIEWS", 200)
+AMAZON_MAX_PAGES = env_int("AMAZON_MAX_PAGES", 20)
+AMAZON_DEADLINE = env_float("AMAZON_DEADLINE", 6)
+# review pages one search requests at the same time
+AMAZON_PAGE_CONCURRENCY = env_int("AMAZON_PAGE_CONCURRENCY", 4)
+# threads for review pages, shared by all product searches and separate from FETCH_WORKERS
+AMAZON_PAGE_WORKERS = env_int("AMAZON_PAGE_WORKERS", 8)
+
+# Aggregate (multi-source) endpoint
+# seconds to wait for all sources before merging whatever has responded
+AGGREGATE_DEADLINE = env_float("AGGREGATE_DEADLINE", 8)
+AGGREGATE_WORKERS = env_int("AGGREGATE_WORKERS", 16)
+# how much each source's rating counts towards the combined rating
+AGGREGATE_WEIGHTS = {
+    "amazon": env_float("AGGREGATE_WEIGHT_AMAZON", 1),
+    "imdb": env_float("AGGREGATE_WEIGHT_IMDB", 1),
+    "reddit": env_float("AGGREGATE_WEIGHT_REDDIT", 1),
+    "twitter": env_float("AGGREGATE_WEIGHT_TWITTER", 1),
+}
+
+# Streaming results
+# emit a running aggregate record after every this many posts
+STREAM_PROGRESS_EVERY = env_int("STREAM_PROGRESS_EVERY", 25)
+
+# Reddit ingestion budget, a search stops at whichever is hit first
+REDDIT_MAX_POSTS = env_int("REDDIT_MAX_POSTS", 500)
+REDDIT_MAX_PAGES = env_int("REDDIT_MAX_PAGES", 5)
+REDDIT_DEADLINE = env_float("REDDIT_DEADLINE", 6)
+
+# Word bubbles
+# n-gram sizes counted, e.g. "1,2" for words and bigrams
+WORD_BUBBLE_NGRAMS = tuple(int(n) for n in env_str("WORD_BUBBLE_NGRAMS", "1").split(","))
+# a term must appear in at least this many posts to be shown
+WORD_BUBBLE_MIN_DF = env_int("WORD_BUBBLE_MIN_DF", 1)
+# optional file of extra stopwords, one per line
+WORD_BUBBLE_STOPWORDS_FILE = env_str("WORD_BUBBLE_STOPWORDS_FILE", "")
+
+# Spelling correction used by George: "symspell", "textblob" or "none"
+GEORGE_CORRECTOR = env_str("GEORGE_CORRECTOR", "symspell")
+SPELLING_MAX_DISTANCE = env_int("SPELLING_MAX_DISTANCE", 2)
+# corrected words remembered per process
+SPELLING_CACHE_SIZE = env_int("SPELLING_CACHE_SIZE", 50000)
+
+# Batch scoring on a process pool, used for large inputs only
+SCORING_PROCESSES = env_int("SCORING_PROCESSES", os.cpu_count() or 1)
+# inputs smaller than this are scored in the request process
+SCORING_BATCH_MIN_SIZE = env_int("SCORING_BATCH_MIN_SIZE", 2000)
+SCORING_CHUNK_SIZE = env_int("SCORING_CHUNK_SIZE", 500)
+# "spawn" is safe to use from a threaded server, "fork" starts faster
+SCORING_START_METHOD = env_str("SCORING_START_METHOD", "spawn")
+
+# Precomputed result snapshots, written by precompute.py
+SNAPSHOT_DIR = env_str("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+# seconds between checks for a newer snapshot version
+SNAPSHOT_RELOAD_INTERVAL = env_int("SNAPSHOT_RELOAD_INTERVAL", 60)
+# seconds after it was generated a snapshot may be served for, per category. Social posts go stale
+# within minutes so those categories default to 0, never served from a snapshot
+SNAPSHOT_MAX_AGES = {
+    "product": env_int("SNAPSHOT_MAX_AGE_PRODUCT", 86400),
+    "movie": env_int("SNAPSHOT_MAX_AGE_MOVIE", 86400),
+}
+SNAPSHOT_DEFAULT_MAX_AGE = env_int("SNAPSHOT_MAX_AGE_DEFAULT", 0)
+
+# Twitter ingestion
+TWITTER_MAX_POSTS = env_int("TWITTER_MAX_POSTS", 500)
+TWITTER_MAX_PAGES = env_int("TWITTER_MAX_PAGES", 5)
+TWITTER_DEADLINE = env_float("TWITTER_DEADLINE", 6)
+# requests per second shared by every search in the process (recent search allows 450 per 15 minutes)
+TWITTER_RATE = env_float("TWITTER_RATE", 0.5)
+TWITTER_BURST = env_int("TWITTER_BURST", 10)
+# longest a search waits for the rate limiter before returning what it has
+TWITTER_MAX_WAIT = env_float("TWITTER_MAX_WAIT", 1)
+# searches whose last tweets are kept to fall back on when rate limited
+TWITTER_FALLBACK_SIZE = env_int("TWITTER_FALLBACK_SIZE", 256)
+
+# Incremental social searches
+# searches whose cursor and running aggregate are kept
+CURSOR_STORE_SIZE = env_int("CURSOR_STORE_SIZE", 1024)
+# seconds before a saved aggregate is thrown away and the search is run in full again
+CURSOR_MAX_AGE = env_int("CURSOR_MAX_AGE", 3600)
+
+# Local store of scored posts and results, for the trend endpoint
+STORE_ENABLED = env_flag("STORE_ENABLED", True)
+STORE_PATH = env_str("STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pov.sqlite3"))
+# days posts and results are kept, and seconds between deleting older ones
+STORE_RETENTION_DAYS = env_float("STORE_RETENTION_DAYS", 30)
+STORE_PRUNE_INTERVAL = env_int("STORE_PRUNE_INTERVAL", 3600)
+# default trend bucket size in seconds
+TREND_BUCKET = env_int("TREND_BUCKET", 3600)
+TREND_MAX_POINTS = env_int("TREND_MAX_POINTS", 500)
+
+# Near-duplicate collapsing of social posts before scoring
+DEDUPE_ENABLED = env_flag("DEDUPE_ENABLED", True)
+# estimated jaccard similarity of the posts' words and word pairs at which they count as the same post
+DEDUPE_THRESHOLD = env_float("DEDUPE_THRESHOLD", 0.6)
+# minhash signature size, split into bands of DEDUPE_NUM_PERM / DEDUPE_BANDS rows for the lsh index
+DEDUPE_NUM_PERM = env_int("DEDUPE_NUM_PERM", 64)
+DEDUPE_BANDS = env_int("DEDUPE_BANDS", 16)
+
+# Tracing, see tracing.py
+TRACING_ENABLED = env_flag("TRACING_ENABLED", True)
+# send each request's stage timings back in a Server-Timing header
+SERVER_TIMING = env_flag("SERVER_TIMING")
+
+# Upstream api base urls, e.g. pointed at Backend/LoadTest/simulator.py for offline load tests
+AMAZON_BASE_URL = env_str("AMAZON_BASE_URL", "https://louissullivcs.pythonanywhere.com")
+IMDB_BASE_URL = env_str("IMDB_BASE_URL", "https://louissullivcs.pythonanywhere.com")
+TWITTER_BASE_URL = env_str("TWITTER_BASE_URL", "https://api.twitter.com")
+# praw's token and api hosts
+REDDIT_URL = env_str("REDDIT_URL", "https://www.reddit.com")
+REDDIT_OAUTH_URL = env_str("REDDIT_OAUTH_URL", "https://oauth.reddit.com")
+
+# Async server, see async_app.py
+# upstream connections kept open in total and per host
+ASYNC_HTTP_LIMIT = env_int("ASYNC_HTTP_LIMIT", 200)
+ASYNC_HTTP_LIMIT_PER_HOST = env_int("ASYNC_HTTP_LIMIT_PER_HOST", 100)
+# threads for scoring and for providers without a non-blocking client (reddit)
+ASYNC_EXECUTOR_WORKERS = env_int("ASYNC_EXECUTOR_WORKERS", 32)
+
+# Upstream resilience, see apis/resilience.py
+# read timeout per upstream, HTTP_READ_TIMEOUT for any other
+UPSTREAM_READ_TIMEOUTS = {
+    "amazon": env_float("READ_TIMEOUT_AMAZON", HTTP_READ_TIMEOUT),
+    "imdb": env_float("READ_TIMEOUT_IMDB", HTTP_READ_TIMEOUT),
+    "twitter": env_float("READ_TIMEOUT_TWITTER", HTTP_READ_TIMEOUT),
+    "reddit": env_float("READ_TIMEOUT_REDDIT", HTTP_READ_TIMEOUT),
+}
+BREAKER_ENABLED = env_flag("BREAKER_ENABLED", True)
+# failures in a row that open an upstream's circuit, and seconds before it is tried again
+BREAKER_FAILURES = env_int("BREAKER_FAILURES", 5)
+BREAKER_RESET = env_float("BREAKER_RESET", 30)
+# serve a search's last good result while its upstream's circuit is open
+SERVE_LAST_GOOD = env_flag("SERVE_LAST_GOOD", True)
+# upstreams whose GETs are hedged, not twitter as every request counts against its quota
+HEDGE_UPSTREAMS = tuple(name for name in env_str("HEDGE_UPSTREAMS", "amazon,imdb").split(",") if name)
+# a GET still running after this percentile of the upstream's recent latencies gets a second request
+HEDGE_PERCENTILE = env_float("HEDGE_PERCENTILE", 95)
+HEDGE_MIN_DELAY = env_float("HEDGE_MIN_DELAY", 0.05)
+# recent latencies kept per upstream, and how many are needed before hedging starts
+LATENCY_WINDOW = env_int("LATENCY_WINDOW", 200)
+HEDGE_MIN_SAMPLES = env_int("HEDGE_MIN_SAMPLES", 20)
+# threads running hedged GETs for the blocking clients
+HEDGE_WORKERS = env_int("HEDGE_WORKERS", 32)
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+
+import tracing
+
+"""
+Request coalescing. While a computation for a key is running, identical calls wait for it and get
+its result (or its exception) instead of starting their own, so a burst of searches for a trending
+term makes one set of upstream calls. Nothing is kept once the computation finishes, caching the
+result is left to cache.py.
+"""
+
+
+class Call:
+    """
+    One running computation and the number of calls waiting on it
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key, from threads with do() or from coroutines on an
+    event loop with do_async(). The two are kept apart because a thread can't await a loop's
+    future. name labels the metrics
+    """
+    def __init__(self, name, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self.leaders = 0
+        self.waiters = 0
+
+    def do(self, key, compute):
+        """
+        Returns compute(), or the result of the identical call already running for key
+        """
+        if not self.enabled:
+            return compute()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Call()
+            else:
+                call.waiters += 1
+        if not leader:
+            self._waiting(1)
+            try:
+                call.done.wait()
+            finally:
+                self._waiting(-1)
+            if call.error is not None:
+                raise call.error
+            return call.value
+        self._started()
+        try:
+            call.value = compute()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            self._finished(call.waiters)
+
+    async def do_async(self, key, compute):
+        """
+        do() for coroutines, compute is a coroutine function. The computation runs in its own
+        task, so a caller being cancelled (e.g. the client went away) doesn't cancel it for the
+        others waiting on it
+        """
+        if not self.enabled:
+            return await compute()
+        flight_key = (asyncio.get_running_loop(), key)
+        task = self._async_calls.get(flight_key)
+        if task is not None:
+            task.waiters += 1
+            self._waiting(1)
+            try:
+                return await asyncio.shield(task)
+            finally:
+                self._waiting(-1)
+        task = asyncio.ensure_future(compute())
+        task.waiters = 0
+        self._async_calls[flight_key] = task
+        self._started()
+
+        def finished(task):
+            self._async_calls.pop(flight_key, None)
+            if not task.cancelled():
+                # marks the exception as retrieved when every caller was cancelled
+                task.exception()
+            self._finished(task.waiters)
+
+        task.add_done_callback(finished)
+        return await asyncio.shield(task)
+
+    def stats(self):
+        with self._lock:
+            calls = self.leaders + self.waiters
+            return {
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "computed": self.leaders,
+                "coalesced": self.waiters,
+                "coalesced_ratio": round(self.waiters / calls, 4) if calls else 0.0,
+            }
+
+    def _started(self):
+        with self._lock:
+            self.leaders += 1
+        tracing.count_coalescing(self.name, "leader")
+
+    def _waiting(self, change):
+        if change > 0:
+            with self._lock:
+                self.waiters += 1
+            tracing.count_coalescing(self.name, "waiter")
+        tracing.waiting_on(self.name, change)
+
+    def _finished(self, waiters):
+        tracing.observe_coalesced(self.name, waiters)
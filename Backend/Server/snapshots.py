@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+
+"""
+Result snapshots precomputed by precompute.py. Each run writes a new version directory
+
+    snapshots/<version>/manifest.json
+    snapshots/<version>/<category>/<TERM>.json
+
+and then points snapshots/LATEST at it, so the server never sees a half written version. A
+snapshot is only served while it is younger than its category's max age.
+"""
+
+SCHEMA = 1
+
+
+def snapshot_key(term, category):
+    return (term.upper().strip().replace(" ", ""), category.lower().strip())
+
+
+def snapshot_path(root, version, category, term):
+    return os.path.join(root, version, category, "{}.json".format(term))
+
+
+def generated_time(snapshot):
+    """
+    Unix time a snapshot's generated_at (local "%Y-%m-%dT%H:%M:%S") stands for
+    """
+    return time.mktime(time.strptime(snapshot["generated_at"], "%Y-%m-%dT%H:%M:%S"))
+
+
+class SnapshotStore:
+    """
+    In memory index of the latest snapshot version, reloaded when LATEST changes. max_ages is
+    the seconds a snapshot can be served for per category, default_max_age for other categories
+    """
+    def __init__(self, root, reload_interval=60, max_ages=None, default_max_age=None):
+        self.root = root
+        self.reload_interval = reload_interval
+        self.max_ages = max_ages or {}
+        self.default_max_age = default_max_age
+        self.version = None
+        self.results = {}
+        self._checked = 0
+        self._lock = threading.Lock()
+        self.try_reload()
+
+    def latest_version(self):
+        try:
+            with open(os.path.join(self.root, "LATEST")) as latest_file:
+                return latest_file.read().strip() or None
+        except OSError:
+            return None
+
+    def reload(self):
+        """
+        Loads the version LATEST points at if it isn't already loaded
+        """
+        self._checked = time.monotonic()
+        version = self.latest_version()
+        if version is None or version == self.version:
+            return
+        results = {}
+        version_dir = os.path.join(self.root, version)
+        for category in os.listdir(version_dir):
+            category_dir = os.path.join(version_dir, category)
+            if not os.path.isdir(category_dir):
+                continue
+            for filename in os.listdir(category_dir):
+                if not filename.endswith(".json"):
+                    continue
+                with open(os.path.join(category_dir, filename)) as json_file:
+                    snapshot = json.load(json_file)
+                if snapshot.get("schema") != SCHEMA:
+                    continue
+                results[snapshot_key(snapshot["term"], snapshot["category"])] = (generated_time(snapshot), snapshot["result"])
+        self.results = results
+        self.version = version
+        print("[snapshots] loaded version {} ({} results)".format(version, len(results)), flush=True)
+
+    def try_reload(self):
+        try:
+            self.reload()
+        except (OSError, ValueError, KeyError) as e:
+            print("[snapshots] could not load: {}".format(e), flush=True)
+
+    def max_age(self, category):
+        return self.max_ages.get(category, self.default_max_age)
+
+    def get(self, term, category):
+        """
+        The precomputed result for term/category, or None if there is none or it is too old
+        """
+        if time.monotonic() - self._checked > self.reload_interval:
+            with self._lock:
+                if time.monotonic() - self._checked > self.reload_interval:
+                    self.try_reload()
+        key = snapshot_key(term, category)
+        snapshot = self.results.get(key)
+        if snapshot is None:
+            return None
+        generated, result = snapshot
+        max_age = self.max_age(key[1])
+        if max_age is not None and time.time() - generated > max_age:
+            return None
+        return result
@@ -0,0 +1,51 @@
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+Records how long each import and model load takes so slow worker boots can be tracked down
+"""
+
+class StartupReport:
+    """
+    Collects named timings and prints them as they happen and as a summary
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings.append((name, elapsed))
+            print("[startup] {} took {:.3f}s".format(name, elapsed), flush=True)
+
+    def total(self):
+        return sum(elapsed for name, elapsed in self.timings)
+
+    def as_dict(self):
+        return {
+            "uptime": round(time.perf_counter() - self.started, 3),
+            "timings": [{"name": name, "seconds": round(elapsed, 3)} for name, elapsed in self.timings],
+            "total": round(self.total(), 3),
+        }
+
+    def __str__(self):
+        lines = ["Startup report:"]
+        for name, elapsed in self.timings:
+            lines.append("  {:<40} {:>8.3f}s".format(name, elapsed))
+        lines.append("  {:<40} {:>8.3f}s".format("total", self.total()))
+        return "\n".join(lines)
+
+
+report = StartupReport()
+
+
+def timed(name):
+    return report.timed(name)
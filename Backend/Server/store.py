@@ -0,0 +1,214 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import settings
+
+"""
+SQLite store of scored posts and of every result we compute, indexed by (term, category, ts) so
+rating trends can be worked out by SQL without calling the apis again. Posts are kept once per
+(source, post_id) however often they are searched, and bucketed by when they were posted. Writes
+go through a single background thread so requests never wait on the database, and rows older than
+STORE_RETENTION_DAYS are deleted from time to time.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    term TEXT NOT NULL,
+    category TEXT NOT NULL,
+    ts REAL NOT NULL,
+    source TEXT NOT NULL,
+    compound REAL NOT NULL,
+    label INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    weight INTEGER NOT NULL DEFAULT 1,
+    post_id TEXT,
+    created_at REAL,
+    UNIQUE (source, post_id)
+);
+CREATE INDEX IF NOT EXISTS posts_term_category_ts ON posts (term, category, ts);
+CREATE TABLE IF NOT EXISTS results (
+    term TEXT NOT NULL,
+    category TEXT NOT NULL,
+    ts REAL NOT NULL,
+    rating REAL NOT NULL,
+    total_reviews INTEGER
+);
+CREATE INDEX IF NOT EXISTS results_term_category_ts ON results (term, category, ts);
+"""
+
+POST_TREND = """
+SELECT CAST(COALESCE(created_at, ts) / :bucket AS INTEGER) * :bucket AS bucket,
+       SUM(weight),
+       CAST(SUM((label >= 0) * weight) * 100 / SUM(weight) AS INTEGER),
+       SUM((label = 1) * weight), SUM((label = 0) * weight), SUM((label = -1) * weight),
+       SUM(compound * weight) / SUM(weight)
+FROM posts
+WHERE term = :term AND category = :category AND source = :source
+  AND COALESCE(created_at, ts) >= :since AND COALESCE(created_at, ts) < :until
+GROUP BY bucket
+ORDER BY bucket
+LIMIT :limit
+"""
+
+RESULT_TREND = """
+SELECT CAST(ts / :bucket AS INTEGER) * :bucket AS bucket,
+       COUNT(*),
+       ROUND(AVG(rating), 2),
+       MAX(total_reviews)
+FROM results
+WHERE term = :term AND category = :category AND ts >= :since AND ts < :until
+GROUP BY bucket
+ORDER BY bucket
+LIMIT :limit
+"""
+
+INSERT_POST = """
+INSERT OR IGNORE INTO posts (term, category, ts, source, compound, label, text, weight, post_id, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def normalize(term, category):
+    return term.upper().strip().replace(" ", ""), category.lower().strip()
+
+
+class PostStore:
+    """
+    One connection per thread, all writes on one writer thread
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pov-store")
+        self._pruned_at = 0
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(posts)")]
+        if "weight" not in columns:
+            conn.execute("ALTER TABLE posts ADD COLUMN weight INTEGER NOT NULL DEFAULT 1")
+        if "post_id" not in columns:
+            conn.execute("ALTER TABLE posts ADD COLUMN post_id TEXT")
+            conn.execute("ALTER TABLE posts ADD COLUMN created_at REAL")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS posts_source_post_id ON posts (source, post_id)")
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql, rows):
+        conn = self.connection()
+        with conn:
+            conn.executemany(sql, rows)
+        if time.time() - self._pruned_at >= settings.STORE_PRUNE_INTERVAL:
+            self.prune()
+
+    def prune(self, now=None):
+        """
+        Deletes the posts and results saved more than STORE_RETENTION_DAYS ago
+        """
+        if now is None:
+            now = time.time()
+        cutoff = now - settings.STORE_RETENTION_DAYS * 86400
+        conn = self.connection()
+        with conn:
+            conn.execute("DELETE FROM posts WHERE ts < ?", (cutoff,))
+            conn.execute("DELETE FROM results WHERE ts < ?", (cutoff,))
+        self._pruned_at = now
+
+    def record_posts(self, term, category, source, scored, posts, ts=None):
+        """
+        Saves scored posts (registry polarity dicts with 'label' set, and 'weight' if the post
+        stands for a cluster of near-duplicates) in the background. posts maps each post's text to
+        its (post id, unix time it was posted). Posts without an id can't be told apart from ones
+        already saved and are skipped, posts already saved are left as they are
+        """
+        if ts is None:
+            ts = time.time()
+        term, category = normalize(term, category)
+        rows = []
+        for p in scored:
+            post_id, created_at = posts.get(p['headline'], (None, None))
+            if post_id is None:
+                continue
+            rows.append((term, category, ts, source, p['compound'], p['label'], p['headline'], p.get('weight', 1),
+                         str(post_id), created_at))
+        if rows:
+            self._writer.submit(self._write, INSERT_POST, rows)
+
+    def record_result(self, term, category, result, ts=None):
+        """
+        Saves the rating of a status 200 result in the background
+        """
+        if result.get("status") != "200":
+            return
+        if ts is None:
+            ts = time.time()
+        term, category = normalize(term, category)
+        try:
+            rating = float(result["rating"])
+            total = result.get("total_reviews", result.get("rating_count"))
+            total = int(str(total).replace(",", "")) if total is not None else None
+        except (KeyError, TypeError, ValueError):
+            return
+        row = (term, category, ts, rating, total)
+        self._writer.submit(self._write, "INSERT INTO results VALUES (?, ?, ?, ?, ?)", [row])
+
+    def trend(self, term, category, bucket, since=None, until=None, source=None, limit=None):
+        """
+        Rating per time bucket. With a source ("reddit" or "twitter") it uses that source's scored
+        posts if there are any for the search, otherwise the saved results (amazon and imdb only
+        save results). Posts are bucketed by when they were posted
+        """
+        term, category = normalize(term, category)
+        params = {
+            "term": term, "category": category, "bucket": bucket,
+            "since": since if since is not None else 0,
+            "until": until if until is not None else time.time() + bucket,
+            "source": source,
+            "limit": limit or settings.TREND_MAX_POINTS,
+        }
+        conn = self.connection()
+        rows = conn.execute(POST_TREND, params).fetchall() if source is not None else []
+        if rows:
+            return "posts", [{"time": row[0], "posts": row[1], "rating": row[2],
+                              "label_counts": {"positive": row[3], "neutral": row[4], "negative": row[5]},
+                              "compound": round(row[6], 4)} for row in rows]
+        rows = conn.execute(RESULT_TREND, params).fetchall()
+        return "results", [{"time": row[0], "results": row[1], "rating": row[2], "total_reviews": row[3]} for row in rows]
+
+
+_store = None
+_lock = threading.Lock()
+
+
+def get_store():
+    """
+    The process wide store, or None if settings.STORE_ENABLED is off
+    """
+    global _store
+    if not settings.STORE_ENABLED:
+        return None
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = PostStore(settings.STORE_PATH)
+    return _store
+
+
+def record_posts(term, category, source, scored, posts):
+    store = get_store()
+    if store is not None and category is not None:
+        store.record_posts(term, category, source, scored, posts)
+
+
+def record_result(term, category, result):
+    store = get_store()
+    if store is not None:
+        store.record_result(term, category, result)
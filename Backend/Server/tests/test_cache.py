@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from cache import ResultCache
+
+"""
+Unit tests for cache.py. Run from Backend/Server with python -m pytest tests (or
+python -m unittest discover tests). The cache's clock is patched so nothing sleeps.
+"""
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch("cache.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ResultCache(max_size=2, ttls={"product": 100}, default_ttl=10, stale_ttl=50)
+        self.calls = 0
+
+    def compute(self, value):
+        def run():
+            self.calls += 1
+            return value
+        return run
+
+    def wait_for_refreshes(self):
+        self.cache._executor.shutdown(wait=True)
+
+    def test_fresh_entry_is_served_without_computing(self):
+        self.assertEqual(self.cache.get_or_compute("ps5", "product", self.compute("a")), "a")
+        self.clock.now += 99
+        self.assertEqual(self.cache.get_or_compute("PS5", "Product", self.compute("b")), "a")
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_ttl_is_per_category(self):
+        self.cache.get_or_compute("fifa", "game", self.compute("a"))
+        self.clock.now += 11
+        # game uses the default ttl of 10, so the entry is stale now
+        self.assertEqual(self.cache.get_or_compute("fifa", "game", self.compute("b")), "a")
+        self.assertEqual(self.cache.stats()["stale_hits"], 1)
+
+    def test_expired_entry_is_computed_again(self):
+        self.cache.get_or_compute("ps5", "product", self.compute("a"))
+        self.clock.now += 100 + 50
+        self.assertEqual(self.cache.get_or_compute("ps5", "product", self.compute("b")), "b")
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_stale_entry_is_served_and_refreshed_in_the_background(self):
+        self.cache.get_or_compute("ps5", "product", self.compute("a"))
+        self.clock.now += 120
+        self.assertEqual(self.cache.get_or_compute("ps5", "product", self.compute("b")), "a")
+        self.wait_for_refreshes()
+        self.assertEqual(self.cache.get("ps5", "product"), "b")
+        self.assertEqual(self.cache.stats()["refreshes"], 1)
+        # the refreshed entry is fresh again
+        self.assertEqual(self.cache.get_or_compute("ps5", "product", self.compute("c")), "b")
+
+    def test_only_one_refresh_runs_per_entry(self):
+        self.cache.get_or_compute("ps5", "product", self.compute("a"))
+        self.clock.now += 120
+        release = threading.Event()
+
+        def slow():
+            release.wait(5)
+            self.calls += 1
+            return "b"
+
+        for i in range(3):
+            self.assertEqual(self.cache.get_or_compute("ps5", "product", slow), "a")
+        release.set()
+        self.wait_for_refreshes()
+        self.assertEqual(self.calls, 2)
+
+    def test_failed_refresh_keeps_the_stale_entry(self):
+        self.cache.get_or_compute("ps5", "product", self.compute("a"))
+        self.clock.now += 120
+
+        def fail():
+            raise ValueError("upstream down")
+
+        self.assertEqual(self.cache.get_or_compute("ps5", "product", fail), "a")
+        self.wait_for_refreshes()
+        self.assertEqual(self.cache.get("ps5", "product"), "a")
+        self.assertEqual(self.cache.stats()["refresh_errors"], 1)
+
+    def test_stale_entry_is_refreshed_on_the_event_loop(self):
+        self.cache.get_or_compute("ps5", "product", self.compute("a"))
+        self.clock.now += 120
+
+        async def compute():
+            return "b"
+
+        async def run():
+            value = await self.cache.get_or_compute_async("ps5", "product", compute)
+            await asyncio.gather(*self.cache._tasks)
+            return value
+
+        self.assertEqual(asyncio.run(run()), "a")
+        self.assertEqual(self.cache.get("ps5", "product"), "b")
+
+    def test_values_rejected_by_should_cache_are_not_stored(self):
+        error = {"status": "503"}
+        self.cache.get_or_compute("ps5", "product", self.compute(error), should_cache=lambda v: v["status"] == "200")
+        self.assertIsNone(self.cache.get("ps5", "product"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.get_or_compute("a", "product", self.compute(1))
+        self.cache.get_or_compute("b", "product", self.compute(2))
+        # a is used again, so b is the least recently used
+        self.cache.get_or_compute("a", "product", self.compute(3))
+        self.cache.get_or_compute("c", "product", self.compute(4))
+        self.assertEqual(self.cache.get("a", "product"), 1)
+        self.assertIsNone(self.cache.get("b", "product"))
+        self.assertEqual(self.cache.get("c", "product"), 4)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
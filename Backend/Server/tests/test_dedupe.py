@@ -0,0 +1,69 @@
+import unittest
+from unittest import mock
+
+from apis.analysis.aggregator import SentimentAggregator
+from apis.analysis.dedupe import NearDuplicates, collapse
+from apis.analysis.registry import registry
+
+"""
+Unit tests for apis/analysis/dedupe.py. Run from Backend/Server with python -m pytest tests (or
+python -m unittest discover tests).
+"""
+
+LOVED = "Dune part two is the best movie I have seen this year"
+LOUD = "The soundtrack was far too loud in my cinema"
+BORING = "Terrible pacing and a boring second half"
+
+POSTS = [
+    LOVED,
+    LOUD,
+    LOVED + " wow",
+    BORING,
+    "RT " + LOVED + " so true",
+    BORING + ", agreed",
+]
+
+# compound scores as the registry would give them
+COMPOUND = {LOVED: 0.8, LOUD: 0.0, BORING: -0.7}
+# a few of nltk's english stopwords, so the word bubble doesn't need the nltk data downloaded
+STOPWORDS = frozenset(["the", "is", "i", "have", "this", "a", "and", "in", "my"])
+
+
+class CollapseTest(unittest.TestCase):
+    def test_near_duplicates_are_merged_into_the_first_post(self):
+        self.assertEqual(collapse(POSTS, enabled=True), [(LOVED, 3), (LOUD, 1), (BORING, 2)])
+
+    def test_distinct_posts_are_kept(self):
+        posts = [LOVED, LOUD, BORING, "Popcorn prices at the cinema are out of control"]
+        self.assertEqual(collapse(posts, enabled=True), [(post, 1) for post in posts])
+
+    def test_every_post_is_its_own_cluster_when_disabled(self):
+        self.assertEqual(collapse(POSTS, enabled=False), [(post, 1) for post in POSTS])
+
+    def test_add_reports_the_cluster_and_whether_it_is_new(self):
+        duplicates = NearDuplicates()
+        self.assertEqual(duplicates.add(LOVED), (0, True))
+        self.assertEqual(duplicates.add(LOUD), (1, True))
+        self.assertEqual(duplicates.add(LOVED + " wow"), (0, False))
+
+    def test_threshold_decides_how_close_a_duplicate_must_be(self):
+        strict = NearDuplicates(threshold=1.0)
+        strict.add(LOVED)
+        self.assertEqual(strict.add(LOVED + " wow"), (1, True))
+
+    @mock.patch.object(registry, "stop_words", lambda: STOPWORDS)
+    def test_cluster_sizes_are_aggregator_weights(self):
+        # as the reddit and twitter providers do: score each representative once, count it size times
+        aggregator = SentimentAggregator(50)
+        for text, size in collapse(POSTS, enabled=True):
+            aggregator.add({"compound": COMPOUND[text], "headline": text}, size)
+        self.assertEqual(aggregator.total(), len(POSTS))
+        self.assertEqual(aggregator.label_counts(), {"positive": 3, "neutral": 1, "negative": 2})
+        self.assertEqual(aggregator.rating(), 66)
+        self.assertEqual(aggregator.top_headlines(1), [LOVED])
+        self.assertEqual(aggregator.words[1].term_counts["dune"], 3)
+        self.assertEqual(aggregator.words[-1].term_counts["boring"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from singleflight import SingleFlight
+
+"""
+Unit tests for singleflight.py. Run from Backend/Server with python -m pytest tests (or
+python -m unittest discover tests).
+"""
+
+CALLERS = 5
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight("test")
+        self.calls = 0
+        self.release = threading.Event()
+
+    def slow(self, value=None, error=None):
+        def compute():
+            self.calls += 1
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return value
+        return compute
+
+    def run_threads(self, compute):
+        """
+        Calls do() from CALLERS threads at once and returns their results (or exceptions)
+        """
+        results = [None] * CALLERS
+
+        def call(i):
+            try:
+                results[i] = self.flights.do("key", compute)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(CALLERS)]
+        for thread in threads:
+            thread.start()
+        # every caller but the leader is waiting once the waiter count is up
+        for i in range(500):
+            if self.flights.waiters == CALLERS - 1:
+                break
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_calls_share_one_computation(self):
+        results = self.run_threads(self.slow("value"))
+        self.assertEqual(results, ["value"] * CALLERS)
+        self.assertEqual(self.calls, 1)
+        stats = self.flights.stats()
+        self.assertEqual((stats["computed"], stats["coalesced"], stats["in_flight"]), (1, CALLERS - 1, 0))
+
+    def test_waiters_get_the_leaders_exception(self):
+        error = ValueError("upstream down")
+        results = self.run_threads(self.slow(error=error))
+        self.assertTrue(all(result is error for result in results))
+        self.assertEqual(self.calls, 1)
+
+    def test_nothing_is_kept_after_the_computation(self):
+        self.release.set()
+        self.assertEqual(self.flights.do("key", self.slow("a")), "a")
+        self.assertEqual(self.flights.do("key", self.slow("b")), "b")
+        self.assertEqual(self.calls, 2)
+
+    def test_disabled_calls_compute_every_time(self):
+        self.flights = SingleFlight("test", enabled=False)
+        self.release.set()
+        for i in range(3):
+            self.flights.do("key", self.slow("a"))
+        self.assertEqual(self.calls, 3)
+
+    def test_concurrent_coroutines_share_one_computation(self):
+        async def run():
+            release = asyncio.Event()
+
+            async def compute():
+                self.calls += 1
+                await release.wait()
+                return "value"
+
+            callers = [asyncio.ensure_future(self.flights.do_async("key", compute)) for i in range(CALLERS)]
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(*callers)
+
+        self.assertEqual(asyncio.run(run()), ["value"] * CALLERS)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flights.stats()["coalesced"], CALLERS - 1)
+
+    def test_cancelled_caller_doesnt_cancel_the_computation(self):
+        async def run():
+            release = asyncio.Event()
+
+            async def compute():
+                await release.wait()
+                return "value"
+
+            leader = asyncio.ensure_future(self.flights.do_async("key", compute))
+            waiter = asyncio.ensure_future(self.flights.do_async("key", compute))
+            await asyncio.sleep(0)
+            leader.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            return await waiter, leader.cancelled()
+
+        self.assertEqual(asyncio.run(run()), ("value", True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,308 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+import settings
+
+"""
+Lightweight request tracing. Code marks its stages with span("score") and upstream calls with
+observe_upstream(), and the times go to process wide histograms served as Prometheus text at
+/metrics. During a request they are also summed per stage on the request's Trace, which can be
+sent back as a Server-Timing header. Work handed to a thread pool keeps the request's Trace if it
+is submitted through wrap().
+"""
+
+# seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# posts per search
+COUNT_BUCKETS = (0, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# requests sharing one computation
+WAITER_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count of observed values, as Prometheus expects them
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Histograms, counters and gauges keyed on a metric name and a tuple of (label, value) pairs
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.help = {}
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def add(self, name, value, **labels):
+        """
+        Moves a gauge up or down by value
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            for kind, series in [("counter", self.counters), ("gauge", self.gauges), ("histogram", self.histograms)]:
+                names = sorted(set(name for name, labels in series))
+                for name in names:
+                    if name in self.help:
+                        lines.append("# HELP {} {}".format(name, self.help[name]))
+                    lines.append("# TYPE {} {}".format(name, kind))
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name != name:
+                            continue
+                        if kind != "histogram":
+                            lines.append("{}{} {}".format(name, format_labels(labels), value))
+                            continue
+                        for bound, count in zip(value.buckets, value.counts):
+                            lines.append("{}_bucket{} {}".format(name, format_labels(labels + (("le", str(bound)),)), count))
+                        lines.append("{}_bucket{} {}".format(name, format_labels(labels + (("le", "+Inf"),)), value.count))
+                        lines.append("{}_sum{} {}".format(name, format_labels(labels), round(value.sum, 6)))
+                        lines.append("{}_count{} {}".format(name, format_labels(labels), value.count))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in labels) + "}"
+
+
+metrics = Metrics()
+metrics.describe("pov_stage_seconds", "Time spent in each stage of a search")
+metrics.describe("pov_upstream_seconds", "Latency of upstream api requests")
+metrics.describe("pov_provider_posts", "Posts or reviews fetched per search")
+metrics.describe("pov_request_seconds", "Time to handle each request")
+metrics.describe("pov_requests_total", "Requests handled")
+metrics.describe("pov_coalesced_requests_total", "Calls that ran a computation (leader) or shared one already running (waiter)")
+metrics.describe("pov_coalesced_waiting", "Calls currently waiting on an identical call's computation")
+metrics.describe("pov_coalesced_waiters", "Calls that shared each computation's result")
+metrics.describe("pov_circuit_open", "1 while an upstream's circuit breaker is open")
+metrics.describe("pov_circuit_opened_total", "Times an upstream's circuit breaker opened")
+metrics.describe("pov_upstream_rejected_total", "Upstream calls failed fast because the circuit was open")
+metrics.describe("pov_hedged_requests_total", "Second requests sent for slow upstream GETs, and how many answered for a failed original")
+metrics.describe("pov_last_good_served_total", "Last good results served while an upstream was unavailable")
+
+
+class Trace:
+    """
+    Total seconds per stage for one request
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """
+        The Server-Timing header value, durations in ms
+        """
+        with self._lock:
+            stages = sorted(self.stages.items())
+        parts = ["{};dur={:.1f}".format(stage, seconds * 1000) for stage, seconds in stages]
+        parts.append("total;dur={:.1f}".format(self.elapsed() * 1000))
+        return ", ".join(parts)
+
+
+_current = contextvars.ContextVar("pov_trace", default=None)
+
+
+def start_trace():
+    """
+    Starts a Trace for the current request and returns it
+    """
+    trace = Trace()
+    _current.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current.get()
+
+
+def end_trace():
+    _current.set(None)
+
+
+def record(stage, seconds):
+    """
+    Adds seconds spent in stage to the metrics and the current request's Trace
+    """
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.observe("pov_stage_seconds", seconds, stage=stage)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def traced(stage):
+    """
+    Decorator that records each call of the function, or coroutine function, as a span
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(func):
+    """
+    Binds func to the current context so spans it records on a pool thread still go to the
+    request's Trace
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
+
+
+def observe_upstream(upstream, seconds, status):
+    """
+    Records one upstream request. status is the http status code or "error"
+    """
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.observe("pov_upstream_seconds", seconds, upstream=upstream, status=str(status))
+    trace = _current.get()
+    if trace is not None:
+        trace.add("upstream-" + upstream, seconds)
+
+
+def count_posts(provider, count):
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.observe("pov_provider_posts", count, buckets=COUNT_BUCKETS, provider=provider)
+
+
+def observe_request(endpoint, status, seconds):
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.observe("pov_request_seconds", seconds, endpoint=endpoint)
+    metrics.inc("pov_requests_total", endpoint=endpoint, status=str(status))
+
+
+def count_coalescing(flight, role):
+    """
+    Counts a call to a SingleFlight (see singleflight.py) as a "leader" or a "waiter"
+    """
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.inc("pov_coalesced_requests_total", flight=flight, role=role)
+
+
+def waiting_on(flight, change):
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.add("pov_coalesced_waiting", change, flight=flight)
+
+
+def observe_coalesced(flight, waiters):
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.observe("pov_coalesced_waiters", waiters, buckets=WAITER_BUCKETS, flight=flight)
+
+
+def circuit_state(upstream, is_open):
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.set("pov_circuit_open", 1 if is_open else 0, upstream=upstream)
+    if is_open:
+        metrics.inc("pov_circuit_opened_total", upstream=upstream)
+
+
+def count_rejected(upstream):
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.inc("pov_upstream_rejected_total", upstream=upstream)
+
+
+def count_hedge(upstream, outcome):
+    """
+    outcome is "sent" for every hedge request and "won" when its answer was used because the
+    original failed
+    """
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.inc("pov_hedged_requests_total", upstream=upstream, outcome=outcome)
+
+
+def count_last_good(category):
+    if not settings.TRACING_ENABLED:
+        return
+    metrics.inc("pov_last_good_served_total", category=category)